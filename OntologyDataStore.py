@@ -1,27 +1,93 @@
+import enum
+import hashlib
+import json
 import re
+import threading
+from collections import OrderedDict
 from datetime import date
-from urllib.request import urlopen
 
-import networkx
 import pyhornedowl
 
+from ontology.ReleaseCache import ReleaseCache
+from ontology.ReleaseIndex import ReleaseIndex
+from ontology.ReleaseRefresher import ReleaseRefresher
+from ontology.SheetOverlay import SheetOverlay
+from ontology.style import NODE_PROPS, REL_COLS
+from utils.dot import to_dot
+
+
+class Expansion(enum.Flag):
+    """
+    Entities that `OntologyDataStore.collectIDs` adds for each collected row
+    """
+    PARENTS = enum.auto()
+    """
+    The entity named in the `Parent` column of the row
+    """
+    DESCENDANTS = enum.auto()
+    """
+    All subclasses in the release and everything reachable in the graph
+    """
+    SUPERCLASSES = enum.auto()
+    """
+    The direct superclasses in the release
+    """
+
+
+def _curation_status_predicate(curation_status):
+    if isinstance(curation_status, str):
+        statuses = {curation_status}
+    else:
+        statuses = set(curation_status or ())
+    statuses.discard("")
+
+    if not statuses:
+        return lambda status: True
+    return lambda status: str(status) in statuses
+
 
 class OntologyDataStore:
-    node_props = {"shape":"box","style":"rounded", "font": "helvetica"}
-    rel_cols = {"has part":"blue","part of":"blue","contains":"green",
-                "has role":"darkgreen","is about":"darkgrey",
-                "has participant":"darkblue"}
+    node_props = NODE_PROPS
+    rel_cols = REL_COLS
 
-    def __init__(self, config):
+    def __init__(self, config, session=None):
         self.releases = {}
         self.releasedates = {}
-        self.label_to_id = {}
-        self.graphs = {}
         self.config = config
+        self.cache = ReleaseCache(config['RELEASE_CACHE_PATH'], ReleaseIndex.VERSION, session)
+        # Parsed sheets by repository, sheet name and content hash. The least recently used ones are evicted first.
+        self.overlays = OrderedDict()
+        self.overlayLock = threading.Lock()
+        self.releaseLock = threading.Lock()
+        self.refresher = None
+
+    def startRefresher(self):
+        """
+        Refresh the releases of all repositories with a release file in the background.
+        """
+        self.refresher = ReleaseRefresher(self.config['RELEASE_FILES'].keys(), self.parseRelease,
+                                          self.config['RELEASE_REFRESH_INTERVAL'])
+        self.refresher.start()
+
+    def ensureRelease(self, repo):
+        """
+        Make sure a release of the repository is available.
+
+        Returns immediately once any release has been loaded. Only before that, it waits for the first background
+        refresh or, if there is none, loads the release itself.
+
+        :param repo: Short name of the repository
+        """
+        if repo in self.releases:
+            return
+        if self.refresher is not None:
+            self.refresher.wait(repo)
+        with self.releaseLock:
+            if repo not in self.releases:
+                self.parseRelease(repo)
 
     def parseRelease(self,repo):
         # Keep track of when you parsed this release
-        self.graphs[repo] = networkx.MultiDiGraph()
         self.releasedates[repo] = date.today()
         #print("Release date ",self.releasedates[repo])
 
@@ -31,410 +97,181 @@ class OntologyDataStore:
         repo_detail = repositories[repo]
         location = f"https://raw.githubusercontent.com/{repo_detail}/master/{ontofilename}"
         print("Fetching release file from", location)
-        data = urlopen(location).read()  # bytes
-        ontofile = data.decode('utf-8')
-
-        # Parse it
-        if ontofile:
-            self.releases[repo] = pyhornedowl.open_ontology(ontofile)
-            prefixes = self.config['PREFIXES']
-            for prefix in prefixes:
-                self.releases[repo].add_prefix_mapping(prefix[0],prefix[1])
-            for classIri in self.releases[repo].get_classes():
-                classId = self.releases[repo].get_id_for_iri(classIri)
-                if classId:
-                    classId = classId.replace(":","_")
-                    # is it already in the graph?
-                    if classId not in self.graphs[repo].nodes:
-                        label = self.releases[repo].get_annotation(classIri, self.config['RDFSLABEL'])
-                        if label:
-                            self.label_to_id[label.strip()] = classId
-                            self.graphs[repo].add_node(classId,
-                                                       label=label.strip().replace(" ", "\n"),
-                                                **OntologyDataStore.node_props)
-                        else:
-                            print("Could not determine label for IRI",classIri)
-                else:
-                    print("Could not determine ID for IRI",classIri)
-            for classIri in self.releases[repo].get_classes():
-                classId = self.releases[repo].get_id_for_iri(classIri)
-                if classId:
-                    parents = self.releases[repo].get_superclasses(classIri)
-                    for p in parents:
-                        plabel = self.releases[repo].get_annotation(p, self.config['RDFSLABEL'])
-                        if plabel and plabel.strip() in self.label_to_id:
-                            self.graphs[repo].add_edge(self.label_to_id[plabel.strip()],
-                                                       classId.replace(":", "_"), dir="back")
-                    axioms = self.releases[repo].get_axioms_for_iri(classIri) # other relationships
-                    for a in axioms:
-                        # Example: ['SubClassOf', 'http://purl.obolibrary.org/obo/CHEBI_27732', ['ObjectSomeValuesFrom', 'http://purl.obolibrary.org/obo/RO_0000087', 'http://purl.obolibrary.org/obo/CHEBI_60809']]
-                        if len(a) == 3 and a[0]=='SubClassOf' \
-                            and isinstance(a[2], list) and len(a[2])==3 \
-                            and a[2][0]=='ObjectSomeValuesFrom':
-                            relIri = a[2][1]
-                            targetIri = a[2][2]
-                            rel_name = self.releases[repo].get_annotation(relIri, self.config['RDFSLABEL'])
-                            targetLabel = self.releases[repo].get_annotation(targetIri, self.config['RDFSLABEL'])
-                            if targetLabel and targetLabel.strip() in self.label_to_id:
-                                if rel_name in OntologyDataStore.rel_cols:
-                                    rcolour = OntologyDataStore.rel_cols[rel_name]
-                                else:
-                                    rcolour = "orange"
-                                self.graphs[repo].add_edge(classId.replace(":", "_"),
-                                                           self.label_to_id[targetLabel.strip()],
-                                                           color=rcolour,
-                                                           label=rel_name)
+        release = self.cache.get(repo, location, self._buildRelease)
+
+        # Swap in the complete snapshot. Readers either see the old or the new release, never a partial one.
+        self.releases[repo] = release
+
+    def _buildRelease(self, data):
+        ontology = pyhornedowl.open_ontology(data.decode('utf-8'))
+        prefixes = self.config['PREFIXES']
+        for prefix in prefixes:
+            ontology.add_prefix_mapping(prefix[0],prefix[1])
+        return ReleaseIndex(ontology, self.config)
 
     def getReleaseLabels(self, repo):
-        all_labels = set()
-        for classIri in self.releases[repo].get_classes():
-            all_labels.add(self.releases[repo].get_annotation(classIri, self.config['RDFSLABEL']))
-        return( all_labels )
-
-    def parseSheetData(self, repo, data):
-        for entry in data:
-            if 'ID' in entry and \
-                    'Label' in entry and \
-                    'Definition' in entry and \
-                    'Parent' in entry and \
-                    len(entry['ID'])>0:
-                entryId = entry['ID'].replace(":", "_")
-                entryLabel = entry['Label'].strip()
-                self.label_to_id[entryLabel] = entryId
-                self.graphs[repo].add_node(entryId, label=entryLabel.replace(" ", "\n"), **OntologyDataStore.node_props)
-                if entryId in self.graphs[repo].nodes:
-                    self.graphs[repo].remove_node(entryId)
-                    self.graphs[repo].add_node(entryId, label=entryLabel.replace(" ", "\n"), **OntologyDataStore.node_props)
-        for entry in data:
-            if 'ID' in entry and \
-                    'Label' in entry and \
-                    'Definition' in entry and \
-                    'Parent' in entry and \
-                    len(entry['ID'])>0:
-                entryParent = re.sub("[\[].*?[\]]", "", str(entry['Parent'])).strip()
-                if entryParent in self.label_to_id:  # Subclass relations
-                    # Subclass relations must be reversed for layout
-                    self.graphs[repo].add_edge(self.label_to_id[entryParent],
-                                               entry['ID'].replace(":", "_"), dir="back")
-                for header in entry.keys():  # Other relations
-                    if entry[header] and str(entry[header]).strip() and "REL" in header:
-                        # Get the rel name
-                        rel_names = re.findall(r"'([^']+)'", header)
-                        if len(rel_names) > 0:
-                            rel_name = rel_names[0]
-                            if rel_name in OntologyDataStore.rel_cols:
-                                rcolour = OntologyDataStore.rel_cols[rel_name]
-                            else:
-                                rcolour = "orange"
-
-                            relValues = entry[header].split(";")
-                            for relValue in relValues:
-                                if relValue.strip() in self.label_to_id:
-                                    self.graphs[repo].add_edge(entry['ID'].replace(":", "_"),
-                                                               self.label_to_id[relValue.strip()],
-                                                               color=rcolour,
-                                                               label=rel_name)
-
- # re-factored the following:
-    # *new : getIDsFromSheetMultiSelect
+        return self.releases[repo].labels()
+
+    def completeLabel(self, repo, term, limit=10):
+        """
+        :param repo: Short name of the repository
+        :param term: Text typed so far
+        :param limit: Maximum number of matches
+        :return: Label and ID of the classes in the release whose label starts with or contains the term
+        """
+        return self.releases[repo].completer.complete(term, limit)
+
+    def parseSheetData(self, repo, data, sheet=""):
+        """
+        Parse the rows of a sheet into an overlay over the current release of the repository.
+
+        Overlays are cached by their content, so parsing the same version of a sheet again is free.
+
+        :param repo: Short name of the repository
+        :param data: Rows of the sheet
+        :param sheet: Name of the sheet
+        :return: The overlay of the sheet
+        """
+        release = self.releases[repo]
+        digest = hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        key = (repo, sheet, digest)
+
+        with self.overlayLock:
+            overlay = self.overlays.get(key)
+            if overlay is not None and overlay.release is release:
+                self.overlays.move_to_end(key)
+                return overlay
+
+        overlay = SheetOverlay(release, data)
+
+        with self.overlayLock:
+            self.overlays[key] = overlay
+            self.overlays.move_to_end(key)
+            while len(self.overlays) > self.config['SHEET_OVERLAY_CACHE_SIZE']:
+                self.overlays.popitem(last=False)
+
+        return overlay
+
+    def collectIDs(self, repo, rows, curation_status=None, expansion=Expansion.PARENTS | Expansion.DESCENDANTS,
+                   overlay=None):
+        """
+        Collect the IDs of the given rows and of the entities related to them.
+
+        Rows with the curation status "Obsolete" are always skipped.
+
+        :param repo: Short name of the repository
+        :param rows: Rows of a spreadsheet as dicts from column name to value
+        :param curation_status: Only include rows with this curation status. Either a single status, a list of
+            statuses or `None`. An empty string or list includes all rows.
+        :param expansion: Which related entities to add for each row
+        :param overlay: Sheet to resolve labels and graph relations in. Only the release is used if `None`.
+        :return: The IDs without duplicates, in the order they were found
+        """
+        release = self.releases[repo]
+        view = overlay if overlay is not None else release
+        accepts = _curation_status_predicate(curation_status)
+
+        ids = {}  # Used as an insertion ordered set
+        seeds = []
+        for entry in rows:
+            status = entry.get('Curation status')
+            if status is not None and str(status) == "Obsolete":
+                continue
+            if not accepts(status):
+                continue
+
+            entry_id = str(entry.get('ID') or "").strip().replace(":", "_")
+            if entry_id:
+                ids[entry_id] = None
+                seeds.append(entry_id)
+
+            if Expansion.PARENTS in expansion and 'Parent' in entry:
+                entryParent = view.lookup(re.sub("[\[].*?[\]]", "", str(entry['Parent'])).strip())
+                if entryParent is not None:
+                    ids[entryParent] = None
+
+            if Expansion.SUPERCLASSES in expansion and entry_id:
+                ids.update(dict.fromkeys(release.superclasses.get(entry_id, ())))
+
+        if Expansion.DESCENDANTS in expansion and seeds:
+            ids.update(dict.fromkeys(release.descendants(seeds)))
+            ids.update(dict.fromkeys(overlay.reachable(seeds) if overlay is not None
+                                     else release.reachability.descendants(seeds)))
+
+        return list(ids)
+
     # getIDsFromSheet - related ID's from whole sheet
     # getIDsFromSelection - related ID's from selection in sheet
     # getRelatedIds - related ID's from list of ID's
+    def getIDsFromSheet(self, repo, data, filter=None, sheet=""):
+        overlay = self.parseSheetData(repo, data, sheet)
+        return self.collectIDs(repo, data, filter, overlay=overlay)
+
+    def getIDsFromSelection(self, repo, data, selectedIds, filter=None, sheet=""):
+        overlay = self.parseSheetData(repo, data, sheet)
+        return self.collectIDs(repo, (data[i] for i in selectedIds), filter, overlay=overlay)
+
+    def getRelatedIDs(self, repo, selectedIds):
+        return self.collectIDs(repo, ({'ID': i} for i in selectedIds),
+                               expansion=Expansion.DESCENDANTS | Expansion.SUPERCLASSES)
 
-    # *new: getIDSForSheetGraphMultiSelect
     # getDotForSheetGraph - graph from whole sheet
     # getDotForSelection - graph from selection in sheet
     # getDotForIDs - graph from ID list
-
-    def getIDsFromSheetMultiSelect(self, repo, data, filter):
-        ids = []
-        for entry in data:
-            if 'Curation status' in entry and str(entry['Curation status']) == "Obsolete":
-                print("Obsolete: ", entry)
-            else:
-                if filter != [""] and filter != []:
-                    for f in filter:
-                        if str(entry['Curation status']) == f:
-                            if 'ID' in entry and len(entry['ID'])>0:
-                                ids.append(entry['ID'].replace(":","_"))
-                            if 'Parent' in entry:
-                                entryParent = re.sub("[\[].*?[\]]", "", str(entry['Parent'])).strip()
-                                if entryParent in self.label_to_id:
-                                    ids.append(self.label_to_id[entryParent])
-                            if ":" in entry['ID'] or "_" in entry['ID']:
-                                entryIri = self.releases[repo].get_iri_for_id(entry['ID'].replace("_", ":"))
-                                if entryIri:
-                                    descs = pyhornedowl.get_descendants(self.releases[repo], entryIri)
-                                    for d in descs:
-                                        ids.append(self.releases[repo].get_id_for_iri(d).replace(":", "_"))
-                            if self.graphs[repo]:
-                                graph_descs = None
-                                try:
-                                    graph_descs = networkx.algorithms.dag.descendants(self.graphs[repo],entry['ID'].replace(":", "_"))
-                                except networkx.exception.NetworkXError:
-                                    print("NetworkXError sheet multiselect: ", entry['ID'])
-
-                                if graph_descs is not None:
-                                    for g in graph_descs:
-                                        if g not in ids:
-                                            ids.append(g)
-
-
-        return (ids)
-
-    def getIDsFromSheet(self, repo, data, filter):
-        # list of ids from sheetExternal
-        ids = []
-        for entry in data:
-            if 'Curation status' in entry and str(entry['Curation status']) == "Obsolete":
-                print("Obsolete: ", entry)
-            else:
-                if filter != "":
-                    if str(entry['Curation status']) == filter:
-                        if 'ID' in entry and len(entry['ID'])>0:
-                            ids.append(entry['ID'].replace(":","_"))
-
-                        if 'Parent' in entry:
-                            entryParent = re.sub("[\[].*?[\]]", "", str(entry['Parent'])).strip()
-                            if entryParent in self.label_to_id:
-                                ids.append(self.label_to_id[entryParent])
-
-                        if ":" in entry['ID'] or "_" in entry['ID']:
-                            entryIri = self.releases[repo].get_iri_for_id(entry['ID'].replace("_", ":"))
-                            if entryIri:
-                                descs = pyhornedowl.get_descendants(self.releases[repo], entryIri)
-                                for d in descs:
-                                    ids.append(self.releases[repo].get_id_for_iri(d).replace(":", "_"))
-                        if self.graphs[repo]:
-                            graph_descs = None
-                            try:
-                                graph_descs = networkx.algorithms.dag.descendants(self.graphs[repo],entry['ID'].replace(":", "_"))
-                            except networkx.exception.NetworkXError:
-                                print("NetworkXError sheet filter: ", entry['ID'])
-
-                            if graph_descs is not None:
-                                for g in graph_descs:
-                                    if g not in ids:
-                                        ids.append(g)
-                else:
-                    if 'ID' in entry and len(entry['ID'])>0:
-                            ids.append(entry['ID'].replace(":","_"))
-
-                    if 'Parent' in entry:
-                        entryParent = re.sub("[\[].*?[\]]", "", str(entry['Parent'])).strip()
-                        print("found entryParent: ", entryParent)
-                        if entryParent in self.label_to_id:
-                            ids.append(self.label_to_id[entryParent])
-                    if ":" in entry['ID'] or "_" in entry['ID']:
-                        entryIri = self.releases[repo].get_iri_for_id(entry['ID'].replace("_", ":"))
-                        if entryIri:
-                            descs = pyhornedowl.get_descendants(self.releases[repo], entryIri)
-                            for d in descs:
-                                ids.append(self.releases[repo].get_id_for_iri(d).replace(":", "_"))
-                    if self.graphs[repo]:
-                        graph_descs = None
-                        try:
-                            graph_descs = networkx.algorithms.dag.descendants(self.graphs[repo],entry['ID'].replace(":", "_"))
-                        except networkx.exception.NetworkXError:
-                            print("NetworkXError Sheet: ", entry['ID'])
-
-                        if graph_descs is not None:
-                            for g in graph_descs:
-                                if g not in ids:
-                                    ids.append(g)
-        return (ids)
-
-    def getIDsFromSelectionMultiSelect(self, repo, data, selectedIds, filter):
-        # Add all descendents of the selected IDs, the IDs and their parents.
-        ids = []
-        for id in selectedIds:
-            entry = data[id]
-            # don't visualise rows which are set to "Obsolete":
-            if 'Curation status' in entry and str(entry['Curation status']) == "Obsolete":
-                pass
-            else:
-                if filter != [""] and filter != []:
-                    for f in filter:
-                        if str(entry['Curation status']) == f:
-                            if str(entry['ID']) and str(entry['ID']).strip(): #check for none and blank ID's
-                                if 'ID' in entry and len(entry['ID']) > 0:
-                                    ids.append(entry['ID'].replace(":", "_"))
-                                if 'Parent' in entry:
-                                    entryParent = re.sub("[\[].*?[\]]", "", str(entry['Parent'])).strip()
-                                    if entryParent in self.label_to_id:
-                                        ids.append(self.label_to_id[entryParent])
-                                if ":" in entry['ID'] or "_" in entry['ID']:
-                                    entryIri = self.releases[repo].get_iri_for_id(entry['ID'].replace("_", ":"))
-                                    if entryIri:
-                                        descs = pyhornedowl.get_descendants(self.releases[repo], entryIri)
-                                        for d in descs:
-                                            ids.append(self.releases[repo].get_id_for_iri(d).replace(":", "_"))
-                                if self.graphs[repo]:
-                                    graph_descs = None
-                                    try:
-                                        graph_descs = networkx.algorithms.dag.descendants(self.graphs[repo],entry['ID'].replace(":", "_"))
-                                    except networkx.exception.NetworkXError:
-                                        print("NetworkXError selection multiselect: ", entry['ID'])
-
-                                    if graph_descs is not None:
-                                        for g in graph_descs:
-                                            if g not in ids:
-                                                ids.append(g)
-        return (ids)
-
-    def getIDsFromSelection(self, repo, data, selectedIds, filter):
-        # Add all descendents of the selected IDs, the IDs and their parents.
-        ids = []
-        for id in selectedIds:
-            entry = data[id]
-            # don't visualise rows which are set to "Obsolete":
-            if 'Curation status' in entry and str(entry['Curation status']) == "Obsolete":
-                pass
-            else:
-                if filter != "":
-                    if str(entry['Curation status']) == filter:
-                        if str(entry['ID']) and str(entry['ID']).strip(): #check for none and blank ID's
-                            if 'ID' in entry and len(entry['ID']) > 0:
-                                ids.append(entry['ID'].replace(":", "_"))
-                            if 'Parent' in entry:
-                                entryParent = re.sub("[\[].*?[\]]", "", str(entry['Parent'])).strip()
-                                if entryParent in self.label_to_id:
-                                    ids.append(self.label_to_id[entryParent])
-                            if ":" in entry['ID'] or "_" in entry['ID']:
-                                entryIri = self.releases[repo].get_iri_for_id(entry['ID'].replace("_", ":"))
-                                if entryIri:
-                                    descs = pyhornedowl.get_descendants(self.releases[repo], entryIri)
-                                    for d in descs:
-                                        ids.append(self.releases[repo].get_id_for_iri(d).replace(":", "_"))
-                            if self.graphs[repo]:
-                                graph_descs = None
-                                try:
-                                    graph_descs = networkx.algorithms.dag.descendants(self.graphs[repo],entry['ID'].replace(":", "_"))
-                                except networkx.exception.NetworkXError:
-                                    print("NetworkXError selection filter: ", str(entry['ID']))
-
-                                if graph_descs is not None:
-                                    for g in graph_descs:
-                                        if g not in ids:
-                                            ids.append(g)
-                else:
-                    if str(entry['ID']) and str(entry['ID']).strip(): #check for none and blank ID's
-                        if 'ID' in entry and len(entry['ID']) > 0:
-                            ids.append(entry['ID'].replace(":", "_"))
-                        if 'Parent' in entry:
-                            entryParent = re.sub("[\[].*?[\]]", "", str(entry['Parent'])).strip()
-                            if entryParent in self.label_to_id:
-                                    ids.append(self.label_to_id[entryParent])
-                        if ":" in entry['ID'] or "_" in entry['ID']:
-                            entryIri = self.releases[repo].get_iri_for_id(entry['ID'].replace("_", ":"))
-                            if entryIri:
-                                descs = pyhornedowl.get_descendants(self.releases[repo], entryIri)
-                                for d in descs:
-                                    ids.append(self.releases[repo].get_id_for_iri(d).replace(":", "_"))
-                        if self.graphs[repo]:
-                            graph_descs = None
-                            try:
-                                graph_descs = networkx.algorithms.dag.descendants(self.graphs[repo],entry['ID'].replace(":", "_"))
-                            except networkx.exception.NetworkXError:
-                                print("NetworkXError selection all: ", str(entry['ID']))
-
-                            if graph_descs is not None:
-                                for g in graph_descs:
-                                    if g not in ids:
-                                        ids.append(g)
-        return (ids)
-
-    def getRelatedIDs(self, repo, selectedIds):
-        # Add all descendents of the selected IDs, the IDs and their parents.
-        ids = []
-        for id in selectedIds:
-            ids.append(id.replace(":","_"))
-            if ":" in id or "_" in id:
-                entryIri = self.releases[repo].get_iri_for_id(id.replace("_", ":"))
-
-                if entryIri:
-                    descs = pyhornedowl.get_descendants(self.releases[repo],entryIri)
-                    for d in descs:
-                        ids.append(self.releases[repo].get_id_for_iri(d).replace(":","_"))
-
-                    superclasses = self.releases[repo].get_superclasses(entryIri)
-                    for s in superclasses:
-                        ids.append(self.releases[repo].get_id_for_iri(s).replace(":", "_"))
-            if self.graphs[repo]:
-                graph_descs = None
-                try:
-                    graph_descs = networkx.algorithms.dag.descendants(self.graphs[repo], id.replace(":", "_"))
-                except networkx.exception.NetworkXError:
-                    print("NetworkXError relatedIDs: ", str(id))
-
-                if graph_descs is not None:
-                    for g in graph_descs:
-                        if g not in ids:
-                            ids.append(g)
-        return (ids)
-
-    def getDotForSheetGraph(self, repo, data, filter):
+    def getDotForSheetGraph(self, repo, data, filter, sheet=""):
         # Get a list of IDs from the sheet graph
-        #todo: is there a better way to do this?
-        if hasattr(filter, 'lower'): #check if filter is a string
-            ids = OntologyDataStore.getIDsFromSheet(self, repo, data, filter)
-        else: #should be a list then
-            ids = OntologyDataStore.getIDsFromSheetMultiSelect(self, repo, data, filter)
-        subgraph = self.graphs[repo].subgraph(ids)
-        P = networkx.nx_pydot.to_pydot(subgraph)
-        return (P)
-
-    def getDotForSelection(self, repo, data, selectedIds, filter):
+        overlay = self.parseSheetData(repo, data, sheet)
+        ids = self.collectIDs(repo, data, filter, overlay=overlay)
+        subgraph = overlay.subgraph(ids)
+        return to_dot(subgraph)
+
+    def getDotForSelection(self, repo, data, selectedIds, filter, sheet=""):
         # Add all descendents of the selected IDs, the IDs and their parents.
-        #todo: is there a better way to do this?
-        if hasattr(filter, 'lower'): #check if filter is a string
-            ids = OntologyDataStore.getIDsFromSelection(self, repo, data, selectedIds, filter)
-        else: #should be a list then
-            ids = OntologyDataStore.getIDsFromSelectionMultiSelect(self, repo, data, selectedIds, filter)
+        overlay = self.parseSheetData(repo, data, sheet)
+        ids = self.collectIDs(repo, (data[i] for i in selectedIds), filter, overlay=overlay)
         # Then get the subgraph as usual
-        subgraph = self.graphs[repo].subgraph(ids)
-        P = networkx.nx_pydot.to_pydot(subgraph)
-        return (P)
+        subgraph = overlay.subgraph(ids)
+        return to_dot(subgraph)
+
+    def getDotsByCurationStatus(self, repo, data, curation_statuses, selectedIds=None, sheet=""):
+        """
+        Render the graph of a sheet once for each curation status.
+
+        The sheet data is parsed once and the rows are partitioned by their curation status. The IDs of each partition
+        are collected once and the graph of all rows is the union of the partitions.
+
+        :param repo: Short name of the repository
+        :param data: All rows of the sheet
+        :param curation_statuses: Statuses to render a graph for. The empty string stands for all rows.
+        :param selectedIds: Indices of the rows to render. All rows if `None`.
+        :param sheet: Name of the sheet
+        :return: DOT string for every requested curation status
+        """
+        overlay = self.parseSheetData(repo, data, sheet)
+        rows = data if selectedIds is None else [data[i] for i in selectedIds]
+
+        partitions = {}
+        for entry in rows:
+            partitions.setdefault(str(entry.get('Curation status')), []).append(entry)
+        ids_by_status = {status: self.collectIDs(repo, partition, overlay=overlay)
+                         for status, partition in partitions.items()}
+
+        dots = {}
+        for status in curation_statuses:
+            if status == "":
+                ids = dict.fromkeys(i for partition_ids in ids_by_status.values() for i in partition_ids)
+            else:
+                ids = ids_by_status.get(status, [])
+            dots[status] = to_dot(overlay.subgraph(ids))
+        return dots
 
     def getDotForIDs(self, repo, selectedIds):
         # Add all descendents of the selected IDs, the IDs and their parents.
-        ids = OntologyDataStore.getRelatedIDs(self, repo, selectedIds)
+        ids = self.getRelatedIDs(repo, selectedIds)
         # Then get the subgraph as usual
-        subgraph = self.graphs[repo].subgraph(ids)
-        P = networkx.nx_pydot.to_pydot(subgraph)
-        return (P)
+        subgraph = self.releases[repo].subgraph(ids)
+        return to_dot(subgraph)
 
     #to create a dictionary and add all info to it, in the relevant place
     def getMetaData(self, repo, allIDS):
-        DEFN = "http://purl.obolibrary.org/obo/IAO_0000115"
-        SYN = "http://purl.obolibrary.org/obo/IAO_0000118"
-
-        label = ""
-        definition = ""
-        synonyms = ""
-        entries = []
-
-
-        all_labels = set()
-        for classIri in self.releases[repo].get_classes():
-            classId = self.releases[repo].get_id_for_iri(classIri).replace(":", "_")
-            for id in allIDS:
-                if id is not None:
-                    if classId == id:
-                        label = self.releases[repo].get_annotation(classIri, self.config['RDFSLABEL']) #yes
-                        iri = self.releases[repo].get_iri_for_label(label)
-                        if self.releases[repo].get_annotation(classIri, DEFN) is not None:
-                            definition = self.releases[repo].get_annotation(classIri, DEFN).replace(",", "").replace("'", "").replace("\"", "")
-                        else:
-                            definition = ""
-                        if self.releases[repo].get_annotation(classIri, SYN) is not None:
-                            synonyms = self.releases[repo].get_annotation(classIri, SYN).replace(",", "").replace("'", "").replace("\"", "")
-                        else:
-                            synonyms = ""
-                        entries.append({
-                            "id": id,
-                            "label": label,
-                            "synonyms": synonyms,
-                            "definition": definition,
-                        })
-        return (entries)
+        return self.releases[repo].get_metadata(i for i in allIDS if i is not None)
@@ -1,19 +1,56 @@
 import logging
 import os.path
-import shutil
+import re
 import threading
-from typing import Generator, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, TypeVar
 
 from flask_github import GitHub
-from whoosh.qparser import MultifieldParser, QueryParser
-
+from whoosh import sorting
+from whoosh.qparser import FuzzyTermPlugin, MultifieldParser, QueryParser
+from whoosh.query import And, FuzzyTerm, Or, Prefix, Term
+from whoosh.writing import MERGE_SMALL, NO_MERGE
+
+from index.BucketSync import IndexConflictError
+from index.CachedBucketStorage import CachedBucketStorage
+from index.EntityGraph import EntityGraph
+from index.IndexOptimizer import IndexOptimizer, merge_smallest
 from index.FileStorage import FileStorage
-from index.create_index import add_entity_data_to_index, to_entity_data_list, re_write_entity_data_set
-from index.schema import schema
-from utils.github import get_spreadsheet, get_spreadsheets
+from index.SearcherPool import SearcherPool
+from index.IndexUpdateWorker import IndexUpdateWorker, SheetUpdate
+from index.SheetManifest import SheetManifest
+from index.SheetPipeline import SheetPipeline
+from index.create_index import add_entity_data_to_index, to_entity_data_list, delete_sheet_from_index
+from index.schema import schema, FACETS, LABEL_NGRAM_MIN, LABEL_NGRAM_MAX
+from utils.concurrency import with_app_context
+from utils.github import get_spreadsheet_bytes, get_spreadsheet_tree
+
+T = TypeVar("T")
+
+
+class SearchPage(NamedTuple):
+    total: int
+    """
+    Number of all hits of the query
+    """
+    offset: int
+    limit: int
+    hits: List[Dict[str, Any]]
+    facets: Dict[str, Dict[Optional[str], int]] = {}
+    """
+    Number of hits by value for each requested facet. Hits without a value are counted under `None`.
+    """
 
 
 class SpreadsheetSearcher:
+    OPTIMIZE_STEP_SEGMENTS = 4
+    """
+    Number of segments merged into one in each step of an optimization
+    """
+    SAVE_ATTEMPTS = 3
+    """
+    Number of times a change is written to the index if another instance saved the index in the meantime
+    """
+
     _logger = logging.getLogger(__name__)
 
     def __init__(self, config: Dict, github: GitHub):
@@ -26,149 +63,420 @@ class SpreadsheetSearcher:
             self._logger.info("Index directory not found. Creating it.")
             os.mkdir(index_dir)
 
-        self.storage = FileStorage(index_dir)
+        if config.get("INDEX_BUCKET") is not None:
+            # The index directory is a local cache of the bucket
+            self.storage = CachedBucketStorage(config["INDEX_BUCKET"], index_dir, config["INDEX_SYNC_WORKERS"])
+            self.storage.load()
+        else:
+            self.storage = FileStorage(index_dir)
 
+        self.manifest = SheetManifest(self.storage)
         if not self.storage.index_exists():
             self._logger.info("Index not found. Creating it.")
 
             self.storage.create_index(schema)
+        elif set(self.storage.open_index().schema.names()) != set(schema.names()):
+            # Sheets are indexed again on the next rebuild, as the new index has an empty manifest
+            self._logger.warning("Index was created with a different schema. Creating a new one.")
+            self.storage.clean()
+            self.storage.create_index(schema)
+            self.manifest.save()
 
+        self.pool = SearcherPool(self.storage.open_index())
+        self.manifest.load()
+        self.graphs: Dict[str, EntityGraph] = {}
+        """
+        Graph of the indexed entities by short name of the repository. Loaded from the index on first use.
+        """
+        self.graphLock = threading.Lock()
+        self.updates = IndexUpdateWorker(self.update_sheets,
+                                         config["INDEX_UPDATE_BATCH_SIZE"],
+                                         config["INDEX_UPDATE_DELAY"])
+        self.updates.start()
+        self.mergetype = NO_MERGE if config["INDEX_MERGE_POLICY"] == "NONE" else MERGE_SMALL
+        self.optimizer = IndexOptimizer(self.optimize_index,
+                                        self.segment_count,
+                                        config["INDEX_OPTIMIZE_SEGMENTS"],
+                                        config["INDEX_OPTIMIZE_INTERVAL"])
+        self.optimizer.start()
 
     def search_for(self, repo_name, search_string="", assigned_user=""):
-        # self.storage.open_from_bucket()
-        ix = self.storage.open_index()
-
+        return self.search_page(repo_name, search_string, assigned_user, limit=100).hits
+
+    def search_page(self,
+                    repo_name: str,
+                    search_string: str = "",
+                    assigned_user: str = "",
+                    offset: int = 0,
+                    limit: int = 100,
+                    fields: Optional[Iterable[str]] = None,
+                    filters: Optional[Dict[str, str]] = None,
+                    facets: Optional[Iterable[str]] = None) -> SearchPage:
+        """
+        Search for entities of a repository and return a single page of the hits.
+
+        :param repo_name: Short name of the repository
+        :param search_string: Query in the whoosh query language. All entities of the repository if empty.
+        :param assigned_user: Only entities to be reviewed by the user with these initials
+        :param offset: Number of hits to skip
+        :param limit: Maximum number of hits to return
+        :param fields: Stored fields to include in each hit. All stored fields if `None`.
+        :param filters: Only hits with these values, by name of the facet, e.g. `{"curation_status": "Proposed"}`
+        :param facets: Names of the facets to count the values of over all hits, e.g. `["curation_status"]`
+        :return: The page of hits, the total number of hits and the facet counts
+        """
+        filters = {name: value for name, value in (filters or {}).items() if value}
+        facets = list(facets or [])
+        for name in list(filters.keys()) + facets:
+            if name not in FACETS:
+                raise ValueError(f"Unknown facet '{name}'")
         mparser = MultifieldParser(["class_id", "label", "definition", "parent", "tobereviewedby"],
-                                   schema=ix.schema)
+                                   schema=schema)
+        # Allows typos in terms marked with a tilde, e.g. "smokng~"
+        mparser.add_plugin(FuzzyTermPlugin())
 
         query = mparser.parse("repo:" + repo_name +
                               (" AND (" + search_string + ")" if search_string else "") +
                               (" AND tobereviewedby:" + assigned_user if assigned_user else ""))
 
-        with ix.searcher() as searcher:
-            results = searcher.search(query, limit=100)
-            resultslist = []
+        offset = max(0, offset)
+        limit = max(1, limit)
+        fields = list(fields) if fields is not None else None
+
+        options = {}
+        if filters:
+            options["filter"] = And([Term(name, value) for name, value in filters.items()])
+        if facets:
+            grouped = sorting.Facets()
+            for name in facets:
+                # Entities can have several relations
+                grouped.add_field(name, allow_overlap=name == "relations", maptype=sorting.Count)
+            options["groupedby"] = grouped
+
+        with self.pool.searcher() as searcher:
+            if offset % limit == 0:
+                pagenum = offset // limit + 1
+                results = searcher.search_page(query, pagenum, pagelen=limit, **options)
+                total = results.total
+                counts = {name: results.results.groups(name) for name in facets}
+                if results.pagenum != pagenum:
+                    # whoosh returns the last page instead of an empty one past the end
+                    results = []
+            else:
+                results = searcher.search(query, limit=offset + limit, **options)
+                total = len(results)
+                counts = {name: results.groups(name) for name in facets}
+                results = results[offset:offset + limit]
+
+            hits = []
             for hit in results:
-                allfields = {}
-                for field in hit:
-                    allfields[field] = hit[field]
-                resultslist.append(allfields)
+                if fields is None:
+                    hits.append(hit.fields())
+                else:
+                    hits.append({field: hit.get(field) for field in fields})
 
-        ix.close()
-        return resultslist
+        # Sortable fields report missing values as empty strings
+        for name, groups in counts.items():
+            counts[name] = {}
+            for value, count in groups.items():
+                counts[name][value or None] = counts[name].get(value or None, 0) + count
 
-    def update_index(self, repo_name, folder, sheet_name, header, sheet_data):
-        self.threadLock.acquire()
-        self._logger.debug("Update of index start")
+        return SearchPage(total, offset, limit, hits, counts)
 
-        writer = None
-        try:
-            ix = self.storage.open_index()
-            writer = ix.writer(timeout=60)  # Wait 60s for the writer lock
-            mparser = MultifieldParser(["repo", "spreadsheet"],
-                                       schema=ix.schema)
-            self._logger.debug("About to delete for query string: " +
-                  "repo:" + repo_name + " AND spreadsheet:'" + folder + "/" + sheet_name + "'")
-            writer.delete_by_query(
-                mparser.parse("repo:" + repo_name + " AND spreadsheet:\"" + folder + "/" + sheet_name + "\""))
-            writer.commit()
-            writer = ix.writer(timeout=60)  # Wait 60s for the writer lock
+    def suggest(self, term: str, repo_name: Optional[str] = None, limit: int = 10) -> List[Dict[str, str]]:
+        """
+        Find entities whose label matches a partially typed term, e.g. to suggest labels while typing.
 
-            for r in range(len(sheet_data)):
-                row = [v for v in sheet_data[r].values()]
-                del row[0]  # Tabulator-added ID column
+        Every word of the term has to match the start of a word in the label or the whole word with at most one typo.
 
-                add_entity_data_to_index((header, row), repo_name, folder + '/' + sheet_name, writer)
+        :param term: The words typed so far
+        :param repo_name: Short name of the repository to search in. All repositories if `None`.
+        :param limit: Maximum number of suggestions
+        :return: Repository, spreadsheet, ID and label of the best matching entities
+        """
+        words = re.findall(r"\w+", term.lower())
+        if not words or limit <= 0:
+            return []
+
+        clauses = []
+        for word in words:
+            if LABEL_NGRAM_MIN <= len(word) <= LABEL_NGRAM_MAX:
+                matches = [Term("label_ngrams", word)]
+            else:
+                # Longer words would match any label word sharing only the indexed n-gram
+                matches = [Prefix("label", word)]
+            if len(word) >= 4:
+                matches.append(FuzzyTerm("label", word, maxdist=1, prefixlength=1))
+            clauses.append(Or(matches))
+        if repo_name:
+            clauses.append(Term("repo", repo_name))
+
+        with self.pool.searcher() as searcher:
+            results = searcher.search(And(clauses), limit=limit)
+            return [{"repo": hit.get("repo"),
+                     "spreadsheet": hit.get("spreadsheet"),
+                     "class_id": hit.get("class_id"),
+                     "label": hit.get("label")} for hit in results]
+
+    def entity_graph(self, repo_name: str) -> EntityGraph:
+        """
+        :param repo_name: Short name of the repository
+        :return: Graph of the entities of all indexed spreadsheets of the repository
+        """
+        with self.graphLock:
+            graph = self.graphs.get(repo_name)
+            if graph is None:
+                sheets: Dict[str, List] = {}
+                with self.pool.searcher() as searcher:
+                    for fields in searcher.documents(repo=repo_name):
+                        entity = EntityGraph.entity(fields)
+                        if entity is not None:
+                            sheets.setdefault(fields.get("spreadsheet"), []).append(entity)
+
+                graph = EntityGraph()
+                for spreadsheet, entities in sheets.items():
+                    graph.replace_sheet(spreadsheet, entities)
+                self.graphs[repo_name] = graph
+            return graph
+
+    def _update_graphs(self, sheets: Dict[Tuple[str, str], Optional[List[Dict]]]) -> None:
+        """
+        Apply committed changes to the loaded entity graphs.
 
-            writer.commit(optimize=True)
+        :param sheets: Fields of the documents by repository and spreadsheet. `None` for removed sheets.
+        """
+        with self.graphLock:
+            for (repo_name, spreadsheet), documents in sheets.items():
+                graph = self.graphs.get(repo_name)
+                if graph is None:
+                    continue
+                if documents is None:
+                    graph.remove_sheet(spreadsheet)
+                else:
+                    graph.replace_sheet(spreadsheet, filter(None, map(EntityGraph.entity, documents)))
+
+    def schedule_update(self, repo_name, folder, sheet_name, header, sheet_data, sha=None):
+        """
+        Queue an update of the index for a saved spreadsheet. It is written in the background.
+        """
+        self.updates.submit(SheetUpdate(repo_name, folder, sheet_name, header, sheet_data, sha))
+
+    def update_index(self, repo_name, folder, sheet_name, header, sheet_data, sha=None):
+        self.update_sheets([SheetUpdate(repo_name, folder, sheet_name, header, sheet_data, sha)])
+
+    def update_sheets(self, updates: List[SheetUpdate]) -> None:
+        """
+        Replace the entries of several spreadsheets in the index with a single commit.
 
-            self.storage.save()
-            ix.close()
-        finally:
-            if writer is not None and not writer.is_closed:
-                writer.cancel()
+        :param updates: New content of the sheets
+        """
+        def write() -> None:
+            writer = None
+            try:
+                ix = self.pool.index
+                writer = ix.writer(timeout=60)  # Wait 60s for the writer lock
+
+                documents = {}
+                for update in updates:
+                    spreadsheet = update.folder + '/' + update.sheet_name
+                    self._logger.debug("About to delete for repo " + update.repo_name + " and spreadsheet '" + spreadsheet + "'")
+                    delete_sheet_from_index(update.repo_name, spreadsheet, writer)
+
+                    sheet_documents = documents[(update.repo_name, spreadsheet)] = []
+                    for r in range(len(update.sheet_data)):
+                        row = [v for v in update.sheet_data[r].values()]
+                        del row[0]  # Tabulator-added ID column
+
+                        sheet_documents.append(add_entity_data_to_index((update.header, row), update.repo_name,
+                                                                        spreadsheet, writer))
+
+                writer.commit(mergetype=self.mergetype)
+                self._update_graphs(documents)
+
+                # Without the SHA of the saved version, the next rebuild has to index the sheet again
+                for update in updates:
+                    self.manifest.set(update.repo_name, update.folder + '/' + update.sheet_name, update.sha)
+                self.manifest.save()
+                self.storage.save()
+            finally:
+                if writer is not None and not writer.is_closed:
+                    writer.cancel()
 
-            self.threadLock.release()
+        self._logger.debug("Update of index start")
+        self._write(write)
 
+        self.optimizer.committed()
         self._logger.debug("Update of index completed.")
 
+    def segment_count(self) -> int:
+        with self.pool.searcher() as searcher:
+            return len(searcher.reader().leaf_readers())
+
+    def optimize_index(self) -> None:
+        """
+        Merge all segments of the index into one.
+
+        Only a few segments are merged at a time and the index is unlocked between the steps, so saves and index
+        updates do not wait for the whole optimization.
+        """
+        def merge() -> None:
+            writer = self.pool.index.writer(timeout=60)  # Wait 60s for the writer lock
+            try:
+                writer.commit(mergetype=merge_smallest(self.OPTIMIZE_STEP_SEGMENTS))
+                self.storage.save()
+            finally:
+                if not writer.is_closed:
+                    writer.cancel()
+
+        # Bounded, so commits arriving in the meantime cannot keep the optimization running
+        for _ in range(self.segment_count()):
+            if self.segment_count() <= 1:
+                break
+            self._write(merge)
+
+    def _write(self, write: Callable[[], T]) -> T:
+        """
+        Change and save the index while holding the thread lock.
+
+        If another instance saved the index since it was loaded, the local commit is discarded, the index is reloaded
+        from the storage and the change is applied again.
+
+        :param write: Changes, commits and saves the index
+        :return: The result of `write`
+        """
+        with self.threadLock:
+            for attempt in range(1, self.SAVE_ATTEMPTS + 1):
+                try:
+                    return write()
+                except IndexConflictError as e:
+                    self._logger.warning(f"{e} Reloading the index (attempt {attempt} of {self.SAVE_ATTEMPTS}).")
+                    # Also after the last attempt, so the index no longer differs from the one in the storage
+                    self._reload()
+                    if attempt == self.SAVE_ATTEMPTS:
+                        raise
+
+    def _reload(self) -> None:
+        """
+        Replace the index and manifest with the ones in the storage. Must be called while holding the thread lock.
+        """
+        self.storage.load()
+        self.manifest.load()
+        self.pool.reset(self.storage.open_index())
+        with self.graphLock:
+            self.graphs = {}
+
     def get_next_id(self, repo_name):
-        self.threadLock.acquire()
-        ix = self.storage.open_index()
+        return self.get_highest_id(repo_name) + 1
 
+    def get_highest_id(self, repo_name):
+        """
+        :return: Highest number of any ID of the repository in the index or 0 if there is none
+        """
         mparser = QueryParser("class_id",
-                              schema=ix.schema)
+                              schema=schema)
         if repo_name == "BCIO":
             updated_repo_name = "BCIO:"  # in order to eliminate "BCIOR" from results
         else:
             updated_repo_name = repo_name
         query = mparser.parse(updated_repo_name.upper() + "*")
-        with ix.searcher() as searcher:
-            results = searcher.search(query, sortedby="class_id", reverse=True)
+        with self.pool.searcher() as searcher:
+            results = searcher.search(query, sortedby="class_id", reverse=True, limit=1)
+            if results.is_empty():
+                return 0
             top_hit = results[0]
-            next_id = int(top_hit['class_id'].split(":")[1]) + 1
-
-        ix.close()
+            return int(top_hit['class_id'].split(":")[1])
 
-        self.threadLock.release()
-        return next_id
-
-    def rebuild_index(self, repository_keys: Optional[List[str]] = None) -> List[str]:
+    def rebuild_index(self, repository_keys: Optional[List[str]] = None, full: bool = False) -> List[str]:
         """
         Rebuild the index for entity data stored in Excel files.
 
         If not list of keys is given, all repositories the current user has access to are indexed.
 
+        Only sheets that were added, removed or changed since they were last indexed are updated. Whether a sheet
+        changed is determined by comparing the blob SHAs in the git tree with the ones in the sheet manifest. All
+        changes are written with a single writer and committed once.
+
         :param repository_keys: List of short names of the repositories to index
-        :return: Names of sheets that have been indexed in the form `repository/file`
+        :param full: Delete the whole index and index all sheets again, e.g. to recover from a corrupted index
+        :return: Names of sheets that are included in the index in the form `repository/file`
         """
-        self.threadLock.acquire()
-
-        try:
-            index_dir = self.config["INDEX_PATH"]
-            shutil.rmtree(index_dir)
-            os.mkdir(index_dir)
-            index = self.storage.create_index(schema)
-            repositories = self.config["REPOSITORIES"]
-
-            def get_excel_files(repo, directory="") -> Generator[str, None, None]:
-
-                directories = self.github.get(
-                    f'repos/{repo}/contents/{directory}'
-                )
-
-                for entry in directories:
-                    if entry['type'] == 'dir':
-                        yield from get_excel_files(repo, entry['path'])
-                    elif entry['type'] == 'file' and entry['name'].endswith('.xlsx'):
-                        yield entry['path']
-
-            sheets = []
-            for repository_key, repository in repositories.items():
-                if repository_keys is not None and repository_key not in repository_keys:
-                    continue
-
-                active_sheets = self.config["ACTIVE_SPREADSHEETS"][repository_key]
-                regex = "|".join(f"({r})" for r in active_sheets)
-
-                excel_files = get_spreadsheets(self.github, repository, include_pattern=regex)
-
-                for file in excel_files:
-                    _, data, _ = get_spreadsheet(self.github, repository, "", file)
-
-                    entity_data = to_entity_data_list(data)
-
-                    spreadsheet = file
+        def rebuild() -> List[str]:
+            writer = None
+            try:
+                if full or not self.manifest.exists():
+                    self._logger.info("Rebuilding the full index")
+                    self.storage.clean()
+                    index = self.storage.create_index(schema)
+                    # Searches see the new index while it is being filled
+                    self.pool.reset(index)
+                    self.manifest.sheets = {}
+                    with self.graphLock:
+                        self.graphs = {}
+                else:
+                    index = self.pool.index
+                repositories = self.config["REPOSITORIES"]
+
+                writer = index.writer(timeout=60)  # Wait 60s for the writer lock
+                documents = {}
+                # Only recorded in the manifest once the changes are committed
+                shas: Dict[Tuple[str, str], Optional[str]] = {}
+                sheets = []
+                jobs = []
+                for repository_key, repository in repositories.items():
+                    if repository_keys is not None and repository_key not in repository_keys:
+                        continue
+
+                    active_sheets = self.config["ACTIVE_SPREADSHEETS"][repository_key]
+                    regex = "|".join(f"({r})" for r in active_sheets)
+
+                    excel_files = get_spreadsheet_tree(self.github, repository, include_pattern=regex)
+                    indexed_files = self.manifest.get(repository_key)
+
+                    for file in indexed_files.keys() - excel_files.keys():
+                        self._logger.debug(f"Removing deleted file '{file}' of repository '{repository_key} ({repository})'")
+                        delete_sheet_from_index(repository_key, file, writer)
+                        shas[(repository_key, file)] = None
+                        documents[(repository_key, file)] = None
+
+                    for file, sha in excel_files.items():
+                        sheets.append(f"{repository}/{file}")
+                        if indexed_files.get(file) != sha:
+                            jobs.append((repository_key, repository, file))
+
+                @with_app_context
+                def fetch(job):
+                    _, repository, file = job
+                    return get_spreadsheet_bytes(self.github, repository, "", file)
+
+                def write(job, sha, parsed):
+                    repository_key, repository, spreadsheet = job
+                    data, _ = parsed
                     self._logger.debug(f"Rewriting entity data for repository '{repository_key} ({repository})' and file '{spreadsheet}'")
-                    re_write_entity_data_set(repository_key, index, spreadsheet, entity_data)
-                    sheets.append(f"{repository}/{file}")
-
-            self.storage.save()
-            index.close()
-
-        finally:
-            self.threadLock.release()
-
+                    delete_sheet_from_index(repository_key, spreadsheet, writer)
+                    documents[(repository_key, spreadsheet)] = [
+                        add_entity_data_to_index(entity_data, repository_key, spreadsheet, writer)
+                        for entity_data in to_entity_data_list(data)]
+                    shas[(repository_key, spreadsheet)] = sha
+
+                pipeline = SheetPipeline(self.config["INDEX_DOWNLOAD_WORKERS"],
+                                         self.config["INDEX_PARSE_PROCESSES"],
+                                         self.config["INDEX_PIPELINE_QUEUE_SIZE"])
+                # Failed sheets keep their previous entries and SHA, so they are tried again on the next rebuild
+                pipeline.run(jobs, fetch, write)
+
+                writer.commit(mergetype=self.mergetype)
+                self._update_graphs(documents)
+                for (repository_key, spreadsheet), sha in shas.items():
+                    self.manifest.set(repository_key, spreadsheet, sha)
+                self.manifest.save()
+                self.storage.save()
+
+            finally:
+                if writer is not None and not writer.is_closed:
+                    writer.cancel()
+
+            return sheets
+
+        sheets = self._write(rebuild)
+        self.optimizer.committed()
         return sheets
-
-
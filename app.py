@@ -16,15 +16,13 @@ import base64
 # [START gae_python37_app]
 import io
 import json
-import threading
 import traceback
-from datetime import date
 from datetime import datetime
 
 import daff
 import openpyxl
 from flask import Flask, request, g, session, redirect, url_for, render_template
-from flask import jsonify
+from flask import jsonify, Response
 from flask_cors import CORS  # enable cross origin request?
 from flask_github import GitHub
 from openpyxl.styles import Font
@@ -34,10 +32,16 @@ from OntologyDataStore import OntologyDataStore
 from SpreadsheetSearcher import SpreadsheetSearcher
 from config import *
 from database.Base import db_session, init_db
+from database.IdAllocator import IdAllocator
 from database.User import User
 from guards.admin import verify_admin
 from guards.verify_login import verify_logged_in
-from utils.github import get_csv, get_spreadsheet
+from index.schema import FACETS
+from utils.concurrency import run_concurrently
+from utils.dot import to_dot
+from utils.github import commit_file, get_contents, get_csv, get_spreadsheet, use_cache
+from utils.GitHubCache import GitHubCache
+from utils.http import PooledSession
 
 # setup sqlalchemy
 
@@ -65,9 +69,28 @@ cors = CORS(app, resources={
 
 app.config.from_object('config')
 
+http_session = PooledSession(app.config['HTTP_POOL_SIZE'], app.config['HTTP_RETRIES'], app.config['HTTP_TIMEOUT'])
 github = GitHub(app)
-searcher = SpreadsheetSearcher(app.config, github)
-ontodb = OntologyDataStore(app.config)
+github.session = http_session
+use_cache(GitHubCache(app.config['GITHUB_CACHE_SIZE'], app.config['GITHUB_CACHE_PATH'],
+                      max_response_bytes=app.config['GITHUB_CACHE_RESPONSE_SIZE']))
+
+
+def highest_used_id(repo_key):
+    highest = searcher.get_highest_id(repo_key)
+    if repo_key in app.config['RELEASE_FILES']:
+        ontodb.ensureRelease(repo_key)
+        highest = max(highest, ontodb.releases[repo_key].highest_id(repo_key.upper()))
+    return highest
+
+
+# Processes started with spawn, e.g. to parse spreadsheets, import the script run with `python app.py` as
+# __mp_main__. They must not load the index or start the background threads again.
+if __name__ != "__mp_main__":
+    searcher = SpreadsheetSearcher(app.config, github)
+    ontodb = OntologyDataStore(app.config, http_session)
+    ontodb.startRefresher()
+    id_allocator = IdAllocator(highest_used_id)
 
 
 @app.before_request
@@ -158,7 +181,8 @@ def user():
 @app.route("/rebuild-index")
 @verify_admin
 def rebuild_index():
-    sheets = searcher.rebuild_index()
+    full = request.args.get("full", "false").lower() in ("1", "true", "yes")
+    sheets = searcher.rebuild_index(full=full)
     return ('<h1>Index rebuild</h1>'
             '<p>The index was rebuild successfully</p>'
             '<p><a href="/">Go back to main page</a></p>'
@@ -167,15 +191,21 @@ def rebuild_index():
             f"{''.join(f'<li>{s}</li>' for s in sheets)}"
             '</ul>')
 
+@app.route("/index-status")
+@verify_admin
+def index_status():
+    return jsonify({**searcher.updates.status(), **searcher.optimizer.status()})
+
+
 @app.route('/search', methods=['POST'])
 @verify_logged_in
 def search():
     searchTerm = request.form.get("inputText")
     repoName = request.form.get("repoName")
-    searchResults = searchAcrossSheets(repoName, searchTerm)
-    searchResultsTable = json.dumps(searchResults)
-    return (json.dumps({"message": "Success",
-                        "searchResults": searchResultsTable}), 200)
+    offset, limit, fields = search_paging()
+    filters, facets = search_facets()
+    searchResults = searchAcrossSheets(repoName, searchTerm, offset, limit, fields, filters, facets)
+    return search_response(searchResults)
 
 
 @app.route('/searchAssignedToMe', methods=['POST'])
@@ -184,11 +214,42 @@ def searchAssignedToMe():
     initials = request.form.get("initials")
     logger.debug("Searching for initials: " + initials)
     repoName = request.form.get("repoName")
+    offset, limit, fields = search_paging()
     # below is searching in "Label" column?
-    searchResults = searchAssignedTo(repoName, initials)
-    searchResultsTable = json.dumps(searchResults)
-    return (json.dumps({"message": "Success",
-                        "searchResults": searchResultsTable}), 200)
+    filters, facets = search_facets()
+    searchResults = searchAssignedTo(repoName, initials, offset, limit, fields, filters, facets)
+    return search_response(searchResults)
+
+
+def search_paging():
+    offset = request.form.get("offset", 0, type=int)
+    limit = min(request.form.get("limit", 100, type=int), app.config['SEARCH_MAX_PAGE_SIZE'])
+    fields = request.form.get("fields")
+    fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    return offset, limit, fields
+
+
+def search_facets():
+    # Filters are passed by facet name, e.g. curation_status=Proposed
+    filters = {name: request.form.get(name) for name in FACETS if request.form.get(name)}
+    facets = request.form.get("facets")
+    facets = [f.strip() for f in facets.split(",") if f.strip() in FACETS] if facets else None
+    return filters, facets
+
+
+def search_response(page):
+    # Stream the hits one by one instead of encoding the whole page at once
+    def generate():
+        yield json.dumps({"message": "Success", "total": page.total, "offset": page.offset, "limit": page.limit,
+                          "facets": {name: {str(value) if value is not None else "": count
+                                            for value, count in counts.items()}
+                                     for name, counts in page.facets.items()}})[:-1]
+        yield ', "searchResults": ['
+        for i, hit in enumerate(page.hits):
+            yield ("," if i > 0 else "") + json.dumps(hit, default=str)
+        yield "]}"
+
+    return Response(generate(), status=200, mimetype="application/json")
 
 
 @app.route('/')
@@ -214,9 +275,7 @@ def home():
 def repo(repo_key, folder_path=""):
     repositories = app.config['REPOSITORIES']
     repo_detail = repositories[repo_key]
-    directories = github.get(
-        f'repos/{repo_detail}/contents/{folder_path}'
-    )
+    directories = get_contents(github, repo_detail, folder_path)
     dirs = []
     spreadsheets = []
     # go to edit_external:
@@ -286,8 +345,9 @@ def generate():
         rowData = json.loads(request.form.get("rowData"))
         values = {}
         ids = {}
+        new_ids = iter(id_allocator.reserve(repo_key, len(rowData)))
         for row in rowData:
-            nextIdStr = str(searcher.get_next_id(repo_key))
+            nextIdStr = str(next(new_ids))
             fill_num = app.config['DIGIT_COUNT']
             if repo_key == "BCIO":
                 fill_num = fill_num - 1
@@ -383,11 +443,6 @@ def edit(repo_key, folder, spreadsheet):
     else:
         logger.info(f"The user {g.user.github_login} has no known metadata")
         user_initials = g.user.github_login[0:2]
-    # Build suggestions data:
-    if repo_key not in ontodb.releases or date.today() > ontodb.releasedates[repo_key]:
-        ontodb.parseRelease(repo_key)
-    suggestions = ontodb.getReleaseLabels(repo_key)
-    suggestions = list(dict.fromkeys(suggestions))
 
     return render_template('edit.html',
                            login=g.user.github_login,
@@ -400,11 +455,37 @@ def edit(repo_key, folder, spreadsheet):
                            rows=json.dumps(rows),
                            file_sha=file_sha,
                            go_to_row=go_to_row,
-                           type=type,
-                           suggestions=json.dumps(suggestions)
+                           type=type
                            )
 
 
+@app.route('/autocomplete', methods=['GET'])
+@verify_logged_in
+def autocomplete():
+    repo_key = request.args.get("repo_key")
+    term = request.args.get("term", "")
+    limit = min(request.args.get("limit", 10, type=int), app.config['AUTOCOMPLETE_MAX_RESULTS'])
+    if repo_key not in app.config['RELEASE_FILES']:
+        return (json.dumps({"message": "Unknown repository", "suggestions": []}), 404)
+
+    ontodb.ensureRelease(repo_key)
+    suggestions = ontodb.completeLabel(repo_key, term, limit)
+    return (json.dumps({"message": "Success", "suggestions": suggestions}), 200)
+
+
+@app.route('/suggest', methods=['GET'])
+@verify_logged_in
+def suggest():
+    repo_key = request.args.get("repo_key")
+    term = request.args.get("term", "")
+    limit = min(request.args.get("limit", 10, type=int), app.config['AUTOCOMPLETE_MAX_RESULTS'])
+    if repo_key and repo_key not in app.config['REPOSITORIES']:
+        return (json.dumps({"message": "Unknown repository", "suggestions": []}), 404)
+
+    suggestions = searcher.suggest(term, repo_key, limit)
+    return (json.dumps({"message": "Success", "suggestions": suggestions}), 200)
+
+
 @app.route('/download_spreadsheet', methods=['POST'])
 @verify_logged_in
 def download_spreadsheet():
@@ -496,6 +577,14 @@ def save():
 
         logger.debug(f"Got file_sha: {file_sha}")
 
+        # Reserve the IDs for all complete rows without one at once. Numbers reserved for a save that fails or
+        # conflicts are not handed out again, so IDs may have gaps, but are never used twice.
+        id_rows = []
+        if all(column in first_row for column in ("ID", "Label", "Parent", "Definition")):  # the right sheet
+            id_rows = [r for r, entry in enumerate(row_data_parsed)
+                       if not entry.get("ID") and entry.get("Label") and entry.get("Parent") and entry.get("Definition")]
+        new_ids = dict(zip(id_rows, id_allocator.reserve(repo_key, len(id_rows))))
+
         wb = openpyxl.Workbook()
         sheet = wb.active
 
@@ -528,24 +617,21 @@ def save():
                         sheet.cell(row=r + 2, column=c + 1).fill = PatternFill(fgColor="2f4f4f", fill_type="solid")
 
             # Generate identifiers:
-            if 'ID' in first_row:
-                if not row[header.index("ID")]:  # blank
-                    if 'Label' and 'Parent' and 'Definition' in first_row:  # make sure we have the right sheet
-                        if row[header.index("Label")] and row[header.index("Parent")] and row[
-                            header.index("Definition")]:  # not blank
-                            # generate ID here:
-                            nextIdStr = str(searcher.get_next_id(repo_key))
-                            fill_num = app.config['DIGIT_COUNT']
-                            if repo_key == "BCIO":
-                                fill_num = fill_num - 1
-                            else:
-                                fill_num = fill_num
-                            id = repo_key.upper() + ":" + nextIdStr.zfill(fill_num)
-                            new_id = id
-                            for c in range(len(header)):
-                                if c == 0:
-                                    restart = True
-                                    sheet.cell(row=r + 2, column=c + 1).value = new_id
+            if r in new_ids:
+                nextIdStr = str(new_ids[r])
+                fill_num = app.config['DIGIT_COUNT']
+                if repo_key == "BCIO":
+                    fill_num = fill_num - 1
+                else:
+                    fill_num = fill_num
+                id = repo_key.upper() + ":" + nextIdStr.zfill(fill_num)
+                new_id = id
+                # The saved rows are indexed, so they must contain the new ID as well
+                row_data_parsed[r]["ID"] = new_id
+                for c in range(len(header)):
+                    if c == 0:
+                        restart = True
+                        sheet.cell(row=r + 2, column=c + 1).value = new_id
 
         # Create version for saving
         spreadsheet_stream = io.BytesIO()
@@ -555,113 +641,120 @@ def save():
         base64_bytes = base64.b64encode(spreadsheet_stream.getvalue())
         base64_string = base64_bytes.decode("ascii")
 
-        # Create a new branch to commit the change to (in case of simultaneous updates)
-        response = github.get(f"repos/{repo_detail}/git/ref/heads/master")
-        if not response or "object" not in response or "sha" not in response["object"]:
-            raise Exception(f"Unable to get SHA for HEAD of master in {repo_detail}")
-        sha = response["object"]["sha"]
-        branch = f"{g.user.github_login}_{datetime.utcnow().strftime('%Y-%m-%d_%H%M%S')}"
-        logger.debug("About to try to create branch in %s", f"repos/{repo_detail}/git/refs")
-        response = github.post(
-            f"repos/{repo_detail}/git/refs", data={"ref": f"refs/heads/{branch}", "sha": sha},
-        )
-        if not response:
-            raise Exception(f"Unable to create new branch {branch} in {repo_detail}")
-
-        logger.debug("About to get latest version of the spreadsheet file %s",
-                     f"repos/{repo_detail}/contents/{folder}/{spreadsheet}")
-        # Get the sha for the file
-        (new_file_sha, new_rows, new_header) = get_spreadsheet(github, repo_detail, folder, spreadsheet)
-
-        # Commit changes to branch (replace code with sheet)
-        data = {
-            "message": commit_msg,
-            "content": base64_string,
-            "branch": branch,
-        }
-        data["sha"] = new_file_sha
-        logger.debug("About to commit file to branch %s", f"repos/{repo_detail}/contents/{folder}/{spreadsheet}")
-        response = github.put(f"repos/{repo_detail}/contents/{folder}/{spreadsheet}", data=data)
-        if not response:
-            raise Exception(
-                f"Unable to commit addition of {spreadsheet} to branch {branch} in {repo_detail}"
+        # Commit directly if neither the file nor master changed since the sheet was loaded
+        saved = commit_file(github, repo_detail, f"{folder}/{spreadsheet}", spreadsheet_stream.getvalue(),
+                            commit_msg + (f"\n\n{commit_msg_extra}" if commit_msg_extra else ""),
+                            None if overwrite else file_sha)
+        if saved is not None:
+            _, new_file_sha = saved
+        else:
+            # On a conflict, fall back to a pull request, which is only merged automatically if the file itself did
+            # not change or the user chose to overwrite it
+            # Create a new branch to commit the change to (in case of simultaneous updates)
+            response = github.get(f"repos/{repo_detail}/git/ref/heads/master")
+            if not response or "object" not in response or "sha" not in response["object"]:
+                raise Exception(f"Unable to get SHA for HEAD of master in {repo_detail}")
+            sha = response["object"]["sha"]
+            branch = f"{g.user.github_login}_{datetime.utcnow().strftime('%Y-%m-%d_%H%M%S')}"
+            logger.debug("About to try to create branch in %s", f"repos/{repo_detail}/git/refs")
+            response = github.post(
+                f"repos/{repo_detail}/git/refs", data={"ref": f"refs/heads/{branch}", "sha": sha},
             )
-
-        # Create a PR for the change
-        logger.debug("About to create PR from branch", )
-        response = github.post(
-            f"repos/{repo_detail}/pulls",
-            data={
-                "title": commit_msg,
-                "head": branch,
-                "base": "master",
-                "body": commit_msg_extra
-            },
-        )
-        if not response:
-            raise Exception(f"Unable to create PR for branch {branch} in {repo_detail}")
-        pr_info = response['html_url']
-
-        # Do not merge automatically if this file was stale as that will overwrite the other changes
-
-        if new_file_sha != file_sha and not overwrite:
-            logger.info("PR created and must be merged manually as repo file had changed")
-
-            # Get the changes between the new file and this one:
-            merge_diff, merged_table = getDiff(row_data_parsed, new_rows, new_header,
-                                               initial_data_parsed)  # getDiff(saving version, latest server version, header for both)
-            # update rows for comparison:
-            (file_sha3, rows3, header3) = get_spreadsheet(github, repo_detail, folder, spreadsheet)
-            # todo: delete transient branch here? Github delete code is a test for now.
-            # Delete the branch again
-            logger.debug("About to delete branch", f"repos/{repo_detail}/git/refs/heads/{branch}")
-            response = github.delete(
-                f"repos/{repo_detail}/git/refs/heads/{branch}")
             if not response:
-                raise Exception(f"Unable to delete branch {branch} in {repo_detail}")
-            return (
-                json.dumps({
-                    'Error': 'Your change was submitted to the repository but could not be automatically merged due to a conflict. You can view the change <a href="' \
-                             + pr_info + '" target = "_blank" >here </a>. ', "file_sha_1": file_sha,
-                    "file_sha_2": new_file_sha, "pr_branch": branch, "merge_diff": merge_diff,
-                    "merged_table": json.dumps(merged_table), \
-                    "rows3": rows3, "header3": header3}), 300  # 400 for missing REPO
-            )
-        else:
-            # Merge the created PR
-            logger.debug("About to merge created PR")
+                raise Exception(f"Unable to create new branch {branch} in {repo_detail}")
+
+            logger.debug("About to get latest version of the spreadsheet file %s",
+                         f"repos/{repo_detail}/contents/{folder}/{spreadsheet}")
+            # Get the sha for the file
+            (new_file_sha, new_rows, new_header) = get_spreadsheet(github, repo_detail, folder, spreadsheet)
+
+            # Commit changes to branch (replace code with sheet)
+            data = {
+                "message": commit_msg,
+                "content": base64_string,
+                "branch": branch,
+            }
+            data["sha"] = new_file_sha
+            logger.debug("About to commit file to branch %s", f"repos/{repo_detail}/contents/{folder}/{spreadsheet}")
+            response = github.put(f"repos/{repo_detail}/contents/{folder}/{spreadsheet}", data=data)
+            if not response:
+                raise Exception(
+                    f"Unable to commit addition of {spreadsheet} to branch {branch} in {repo_detail}"
+                )
+
+            # Create a PR for the change
+            logger.debug("About to create PR from branch", )
             response = github.post(
-                f"repos/{repo_detail}/merges",
+                f"repos/{repo_detail}/pulls",
                 data={
+                    "title": commit_msg,
                     "head": branch,
                     "base": "master",
-                    "commit_message": commit_msg
+                    "body": commit_msg_extra
                 },
             )
             if not response:
-                raise Exception(f"Unable to merge PR from branch {branch} in {repo_detail}")
-
-            # Delete the branch again
-            logger.debug("About to delete branch %s", f"repos/{repo_detail}/git/refs/heads/{branch}")
-            response = github.delete(
-                f"repos/{repo_detail}/git/refs/heads/{branch}")
-            if not response:
-                raise Exception(f"Unable to delete branch {branch} in {repo_detail}")
+                raise Exception(f"Unable to create PR for branch {branch} in {repo_detail}")
+            pr_info = response['html_url']
+
+            # Do not merge automatically if this file was stale as that will overwrite the other changes
+
+            if new_file_sha != file_sha and not overwrite:
+                logger.info("PR created and must be merged manually as repo file had changed")
+
+                # Get the changes between the new file and this one:
+                merge_diff, merged_table = getDiff(row_data_parsed, new_rows, new_header,
+                                                   initial_data_parsed)  # getDiff(saving version, latest server version, header for both)
+                # update rows for comparison:
+                (file_sha3, rows3, header3) = get_spreadsheet(github, repo_detail, folder, spreadsheet)
+                # todo: delete transient branch here? Github delete code is a test for now.
+                # Delete the branch again
+                logger.debug("About to delete branch", f"repos/{repo_detail}/git/refs/heads/{branch}")
+                response = github.delete(
+                    f"repos/{repo_detail}/git/refs/heads/{branch}")
+                if not response:
+                    raise Exception(f"Unable to delete branch {branch} in {repo_detail}")
+                return (
+                    json.dumps({
+                        'Error': 'Your change was submitted to the repository but could not be automatically merged due to a conflict. You can view the change <a href="' \
+                                 + pr_info + '" target = "_blank" >here </a>. ', "file_sha_1": file_sha,
+                        "file_sha_2": new_file_sha, "pr_branch": branch, "merge_diff": merge_diff,
+                        "merged_table": json.dumps(merged_table), \
+                        "rows3": rows3, "header3": header3}), 300  # 400 for missing REPO
+                )
+            else:
+                # Merge the created PR
+                logger.debug("About to merge created PR")
+                response = github.post(
+                    f"repos/{repo_detail}/merges",
+                    data={
+                        "head": branch,
+                        "base": "master",
+                        "commit_message": commit_msg
+                    },
+                )
+                if not response:
+                    raise Exception(f"Unable to merge PR from branch {branch} in {repo_detail}")
+
+                # Delete the branch again
+                logger.debug("About to delete branch %s", f"repos/{repo_detail}/git/refs/heads/{branch}")
+                response = github.delete(
+                    f"repos/{repo_detail}/git/refs/heads/{branch}")
+                if not response:
+                    raise Exception(f"Unable to delete branch {branch} in {repo_detail}")
+
+            # Get the sha AGAIN for the file
+            response = github.get(f"repos/{repo_detail}/contents/{folder}/{spreadsheet}")
+            if not response or "sha" not in response:
+                raise Exception(
+                    f"Unable to get the newly updated SHA value for {spreadsheet} in {repo_detail}/{folder}"
+                )
+            new_file_sha = response['sha']
 
         logger.info("Save succeeded.")
+
         # Update the search index for this file ASYNCHRONOUSLY (don't wait)
-        thread = threading.Thread(target=searcher.update_index,
-                                  args=(repo_key, folder, spreadsheet, header, row_data_parsed))
-        thread.daemon = True  # Daemonize thread
-        thread.start()  # Start the execution
-
-        # Get the sha AGAIN for the file
-        response = github.get(f"repos/{repo_detail}/contents/{folder}/{spreadsheet}")
-        if not response or "sha" not in response:
-            raise Exception(
-                f"Unable to get the newly updated SHA value for {spreadsheet} in {repo_detail}/{folder}"
-            )
-        new_file_sha = response['sha']
+        searcher.schedule_update(repo_key, folder, spreadsheet, header, row_data_parsed, new_file_sha)
         if restart:  # todo: does this need to be anywhere else also?
             return (json.dumps({"message": "Success",
                                 "file_sha": new_file_sha}), 360)
@@ -715,9 +808,8 @@ def openVisualiseAcrossSheets():
         idString = request.form.get("idList")
         repo = request.form.get("repo")
         idList = idString.split()
-        ontodb.parseRelease(repo)
         # todo: do we need to support more than one repo at a time here?
-        dotStr = ontodb.getDotForIDs(repo, idList).to_string()
+        dotStr = getDotForIndexedIDs(repo, idList)
         return render_template("visualise.html", sheet="selection", repo=repo, dotStr=dotStr)
 
     return ("Only POST allowed.")
@@ -733,8 +825,7 @@ def apiOpenVisualiseAcrossSheets():
         idString = request.form.get("idList")
         repo = request.form.get("repo")
         idList = idString.split()
-        ontodb.parseRelease(repo)
-        dotStr = ontodb.getDotForIDs(repo, idList).to_string()
+        dotStr = getDotForIndexedIDs(repo, idList)
         # NOTE: APP_TITLE2 can't be blank - messes up the spacing
         APP_TITLE2 = "VISUALISATION"  # could model this on calling url here? Or something else..
         return render_template("visualise.html", sheet="selection", repo=repo, dotStr=dotStr, api=True,
@@ -761,52 +852,23 @@ def openVisualise():
         except Exception as err:
             filter = ""
             logger.error(str(err))
-        if repo not in ontodb.releases:
-            ontodb.parseRelease(repo)
-
-        if len(indices) > 0:  # visualise selection
-            # check if filter is greater than 1:
-            if len(filter) > 1 and filter != "":  # multi-select:
-                for i in range(0, 2):
-                    ontodb.parseSheetData(repo, table)
-                    dotStr = ontodb.getDotForSelection(repo, table, indices,
-                                                       filter).to_string()  # filter is a list of strings here
+        ontodb.ensureRelease(repo)
+
+        selection = indices if len(indices) > 0 else None
+        # check if filter is greater than 1:
+        if len(filter) > 1 and filter != "":  # multi-select:
+            if selection is not None:  # visualise selection
+                dotStr = ontodb.getDotForSelection(repo, table, indices, filter,
+                                                   sheet)  # filter is a list of strings here
             else:
-                for filter in curation_status_filters:
-                    # loop this twice to mitigate ID bug:
-                    for i in range(0, 2):
-                        ontodb.parseSheetData(repo, table)
-                        dotStr = ontodb.getDotForSelection(repo, table, indices, filter).to_string()
-                    # append dotStr to dotstr_list
-                    dotstr_list.append(dotStr)  # all possible graphs
-                # calculate default all values:
-                filter = ""  # default
-                for i in range(0, 2):
-                    ontodb.parseSheetData(repo, table)
-                    dotStr = ontodb.getDotForSelection(repo, table, indices, filter).to_string()
-
+                dotStr = ontodb.getDotForSheetGraph(repo, table, filter, sheet)
         else:
-            # check if filter is greater than 1:
-            if len(filter) > 1 and filter != "":  # multi-select:
-                for i in range(0, 2):
-                    ontodb.parseSheetData(repo, table)
-                    dotStr = ontodb.getDotForSheetGraph(repo, table,
-                                                        filter).to_string()  # filter is a list of strings here
-                    # no dotstr_list here, just one dotStr
-                    # dotstr_list.append(dotStr) #all possible graphs
-            else:
-                for filter in curation_status_filters:  # Visualise sheet
-                    # loop this twice to mitigate ID bug:
-                    for i in range(0, 2):
-                        ontodb.parseSheetData(repo, table)
-                        dotStr = ontodb.getDotForSheetGraph(repo, table, filter).to_string()
-                    # append dotStr to dotstr_list
-                    dotstr_list.append(dotStr)  # all possible graphs
-                # calculate default all values:
-                filter = ""  # default
-                for i in range(0, 2):
-                    ontodb.parseSheetData(repo, table)
-                    dotStr = ontodb.getDotForSheetGraph(repo, table, filter).to_string()
+            # all possible graphs in one pass
+            dots = ontodb.getDotsByCurationStatus(repo, table, curation_status_filters, selection, sheet)
+            dotstr_list = [dots[f] for f in curation_status_filters]
+            # calculate default all values:
+            filter = ""  # default
+            dotStr = dots[filter]
 
         return render_template("visualise.html", sheet=sheet, repo=repo, dotStr=dotStr, dotstr_list=dotstr_list,
                                filter=filter)
@@ -835,16 +897,12 @@ def openPat():
         indices = json.loads(request.form.get("indices"))
         # print("indices are: ", indices)
 
-        if repo not in ontodb.releases:
-            ontodb.parseRelease(repo)
+        ontodb.ensureRelease(repo)
         if len(indices) > 0:  # selection
-            # ontodb.parseSheetData(repo,table)
-            allIDS = ontodb.getIDsFromSelection(repo, table, indices)
+            allIDS = ontodb.getIDsFromSelection(repo, table, indices, sheet=sheet)
             # print("got allIDS: ", allIDS)
         else:  # whole sheet..
-            ontodb.parseSheetData(repo, table)
-            allIDS = ontodb.getIDsFromSheet(repo, table)
-            # todo: do we need to do above twice?
+            allIDS = ontodb.getIDsFromSheet(repo, table, sheet=sheet)
 
         # print("allIDS: ", allIDS)
         # remove duplicates from allIDS:
@@ -873,7 +931,7 @@ def openPatAcrossSheets():
         #     print("i is: ", i)
         # indices = json.loads(request.form.get("indices"))
         # print("indices are: ", indices)
-        ontodb.parseRelease(repo)
+        ontodb.ensureRelease(repo)
         # todo: do we need to support more than one repo at a time here?
         allIDS = ontodb.getRelatedIDs(repo, idList)
         # print("allIDS: ", allIDS)
@@ -898,9 +956,7 @@ def edit_external(repo_key, folder_path):
     repo_detail = repositories[repo_key]
     folder = folder_path
     spreadsheets = []
-    directories = github.get(
-        f'repos/{repo_detail}/contents/{folder_path}'
-    )
+    directories = get_contents(github, repo_detail, folder_path)
     for directory in directories:
         spreadsheets.append(directory['name'])
     # todo: need unique name for each? Or do we append to big array?
@@ -908,10 +964,13 @@ def edit_external(repo_key, folder_path):
     #     print("spreadsheet: ", spreadsheet)
 
     sheet1, sheet2, sheet3 = spreadsheets
-    (file_sha1, rows1, header1) = get_spreadsheet(github, repo_detail, folder, sheet1)
-    # not a spreadsheet but a csv file:
-    (file_sha2, rows2, header2) = get_csv(github, repo_detail, folder, sheet2)
-    (file_sha3, rows3, header3) = get_csv(github, repo_detail, folder, sheet3)
+    ((file_sha1, rows1, header1),
+     (file_sha2, rows2, header2),
+     (file_sha3, rows3, header3)) = run_concurrently(
+        lambda: get_spreadsheet(github, repo_detail, folder, sheet1),
+        # not a spreadsheet but a csv file:
+        lambda: get_csv(github, repo_detail, folder, sheet2),
+        lambda: get_csv(github, repo_detail, folder, sheet3))
     return render_template('edit_external.html',
                            login=g.user.github_login,
                            repo_name=repo_key,
@@ -1116,14 +1175,20 @@ def getDiff(row_data_1, row_data_2, row_header, row_data_3):  # (1saving, 2serve
     return (table_diff_html, dataDict)
 
 
-def searchAcrossSheets(repo_name, search_string):
-    searcherAllResults = searcher.search_for(repo_name, search_string=search_string)
-    return searcherAllResults
+def getDotForIndexedIDs(repo_name, ids):
+    # The graph of the index includes unreleased entities and does not need the release
+    graph = searcher.entity_graph(repo_name)
+    return to_dot(graph.subgraph(graph.related_ids(ids)))
+
+
+def searchAcrossSheets(repo_name, search_string, offset=0, limit=100, fields=None, filters=None, facets=None):
+    return searcher.search_page(repo_name, search_string=search_string, offset=offset, limit=limit, fields=fields,
+                                filters=filters, facets=facets)
 
 
-def searchAssignedTo(repo_name, initials):
-    searcherAllResults = searcher.search_for(repo_name, assigned_user=initials)
-    return searcherAllResults
+def searchAssignedTo(repo_name, initials, offset=0, limit=100, fields=None, filters=None, facets=None):
+    return searcher.search_page(repo_name, assigned_user=initials, offset=offset, limit=limit, fields=fields,
+                                filters=filters, facets=facets)
 
 
 if __name__ == "__main__":  # on running python app.py
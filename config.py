@@ -5,6 +5,102 @@ APP_TITLE = "Ontology Spreadsheet Editor"
 
 DATABASE_URI = 'sqlite:////tmp/github-flask-ontospreaded.db'
 
+RELEASE_CACHE_PATH = os.environ.get("RELEASE_CACHE_PATH", "/tmp/ontospreaded-releases")
+"""
+Directory where parsed releases are cached between restarts
+"""
+
+RELEASE_REFRESH_INTERVAL = int(os.environ.get("RELEASE_REFRESH_INTERVAL", 60 * 60))
+"""
+Seconds between two checks for a new release of an ontology
+"""
+
+AUTOCOMPLETE_MAX_RESULTS = 50
+"""
+Maximum number of label suggestions returned for one autocomplete request
+"""
+
+SHEET_OVERLAY_CACHE_SIZE = int(os.environ.get("SHEET_OVERLAY_CACHE_SIZE", 32))
+"""
+Number of parsed spreadsheets kept in memory for visualisations
+"""
+
+INDEX_DOWNLOAD_WORKERS = int(os.environ.get("INDEX_DOWNLOAD_WORKERS", 8))
+"""
+Number of spreadsheets downloaded concurrently when rebuilding the index
+"""
+
+INDEX_PARSE_PROCESSES = int(os.environ.get("INDEX_PARSE_PROCESSES", min(4, os.cpu_count() or 1)))
+"""
+Number of processes parsing spreadsheets when rebuilding the index. With 0, they are parsed in the download threads.
+"""
+
+INDEX_PIPELINE_QUEUE_SIZE = int(os.environ.get("INDEX_PIPELINE_QUEUE_SIZE", 16))
+"""
+Maximum number of parsed spreadsheets waiting to be written to the index
+"""
+
+INDEX_UPDATE_BATCH_SIZE = int(os.environ.get("INDEX_UPDATE_BATCH_SIZE", 20))
+"""
+Maximum number of saved spreadsheets written to the index with one commit
+"""
+
+INDEX_UPDATE_DELAY = float(os.environ.get("INDEX_UPDATE_DELAY", 1.0))
+"""
+Seconds to wait for further saves before writing them to the index
+"""
+
+INDEX_MERGE_POLICY = os.environ.get("INDEX_MERGE_POLICY", "SMALL").upper()
+"""
+How commits merge segments of the index. "SMALL" merges small segments, "NONE" never merges. All segments are
+merged in the background as configured by `INDEX_OPTIMIZE_SEGMENTS` and `INDEX_OPTIMIZE_INTERVAL`.
+"""
+
+INDEX_OPTIMIZE_SEGMENTS = int(os.environ.get("INDEX_OPTIMIZE_SEGMENTS", 10))
+"""
+Merge all segments of the index in the background once a commit leaves more segments than this
+"""
+
+INDEX_OPTIMIZE_INTERVAL = float(os.environ.get("INDEX_OPTIMIZE_INTERVAL", 6 * 60 * 60))
+"""
+Seconds between scheduled merges of all segments of the index. 0 disables them.
+"""
+
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 16))
+"""
+Maximum number of connections kept alive per host for requests to GitHub
+"""
+
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 30))
+"""
+Seconds to wait for connecting to GitHub and for each read
+"""
+
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", 3))
+"""
+Number of retries of failed connections and of GET requests failing with a gateway error
+"""
+
+GITHUB_CACHE_PATH = os.environ.get("GITHUB_CACHE_PATH", "/tmp/ontospreaded-github")
+"""
+Directory where responses of the GitHub API and file contents are cached
+"""
+
+GITHUB_CACHE_SIZE = int(os.environ.get("GITHUB_CACHE_SIZE", 64 * 1024 * 1024))
+"""
+Maximum number of bytes of file contents cached in memory and on disk each
+"""
+
+GITHUB_CACHE_RESPONSE_SIZE = int(os.environ.get("GITHUB_CACHE_RESPONSE_SIZE", 16 * 1024 * 1024))
+"""
+Maximum number of bytes of GitHub API responses cached on disk
+"""
+
+SEARCH_MAX_PAGE_SIZE = 1000
+"""
+Maximum number of hits returned for one search request
+"""
+
 RELEASE_FILES = {"AddictO": "addicto-merged.owx",
                  "BCIO": "Upper%20Level%20BCIO/bcio.owl"}
 
@@ -88,6 +184,18 @@ if DEPLOYMENT_MODE == "GOOGLE_CLOUD":
     storage_client = storage.Client()
     GOOGLE_INDEX_BUCKET = os.environ.get("GOOGLE_INDEX_BUCKET", 'index-spread-ed')
     bucket = storage_client.get_bucket(GOOGLE_INDEX_BUCKET)
+    INDEX_BUCKET = bucket
+    """
+    Bucket the index is stored in. The instances keep a copy of it in `INDEX_PATH`.
+    """
+    INDEX_PATH = os.environ.get("INDEX_PATH", "/tmp/ontospreaded-index")
+    """
+    Local copy of the index in the bucket. On App Engine standard, `/tmp` is in memory and not kept across restarts.
+    """
+    INDEX_SYNC_WORKERS = int(os.environ.get("INDEX_SYNC_WORKERS", 8))
+    """
+    Number of index files up- or downloaded concurrently
+    """
 
     # Create the Secret Manager client.
     client = secretmanager.SecretManagerServiceClient()
@@ -116,6 +224,16 @@ if DEPLOYMENT_MODE == "GOOGLE_CLOUD":
     SECRET_KEY = response.payload.data.decode("UTF-8")
 elif DEPLOYMENT_MODE == "LOCAL":
     INDEX_PATH = os.environ.get("INDEX_PATH")
+    INDEX_BUCKET_PATH = os.environ.get("INDEX_BUCKET_PATH")
+    """
+    Directory that stands in for the bucket of a Google Cloud deployment, e.g. to test synchronising the index without
+    Google Cloud. The index is only kept in `INDEX_PATH` if not set.
+    """
+    if INDEX_BUCKET_PATH:
+        from index.LocalBucket import LocalBucket
+
+        INDEX_BUCKET = LocalBucket(INDEX_BUCKET_PATH)
+        INDEX_SYNC_WORKERS = int(os.environ.get("INDEX_SYNC_WORKERS", 8))
 
 USERS_METADATA = {"tomjuggler": {"initials": "ZZ", "repositories": ["AddictO", "BCIO"]},
                   "jannahastings": {"initials": "JH", "repositories": ["AddictO", "BCIO"], "admin": True},
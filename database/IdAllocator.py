@@ -0,0 +1,74 @@
+import logging
+import threading
+from typing import Callable
+
+from sqlalchemy import case, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from database.Base import engine
+from database.NextId import NextId, add_unique_repo_names
+
+
+class IdAllocator:
+    """
+    Hands out the numbers of new entity IDs from a counter per repository stored in the database.
+
+    Numbers are reserved in ranges within a single transaction, so no number is handed out twice, even if the rows
+    using it have not been saved or indexed yet. Every reservation starts after both the counter and the highest number
+    currently in use, so IDs added outside the app or handed out by other instances with their own database are
+    skipped as soon as they are indexed or released.
+    """
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, highest_used: Callable[[str], int], bind=engine):
+        """
+        :param highest_used: Returns the highest number already in use in a repository, e.g. in the index or in the
+            release. Called outside of any transaction on every reservation, so it should be fast.
+        :param bind: Database engine the counters are stored in
+        """
+        self.highest_used = highest_used
+        self._session = sessionmaker(bind=bind)
+        add_unique_repo_names(bind)
+        # SQLite only allows one writer at a time anyway. Serialising here avoids failing on its lock.
+        self._lock = threading.Lock()
+
+    def reserve(self, repo_name: str, count: int = 1) -> range:
+        """
+        Reserve a range of numbers for new IDs.
+
+        :param repo_name: Short name of the repository
+        :param count: Number of IDs to reserve
+        :return: The reserved numbers
+        """
+        if count <= 0:
+            return range(0)
+
+        with self._lock:
+            for _ in range(2):
+                try:
+                    return self._reserve(repo_name, count)
+                except IntegrityError:
+                    # The counter was created concurrently by another process. It is incremented on the next try.
+                    self._logger.debug(f"Counter for '{repo_name}' created concurrently. Retrying.")
+            return self._reserve(repo_name, count)
+
+    def _reserve(self, repo_name: str, count: int) -> range:
+        # Finding the highest number in use may load a release, so it must not hold the write lock of the database
+        start = self.highest_used(repo_name) + 1
+
+        with self._session() as session, session.begin():
+            # Incrementing first acquires the write lock before the counter is read
+            result = session.execute(update(NextId)
+                                      .where(NextId.repo_name == repo_name)
+                                      .values(next_id=case((NextId.next_id > start, NextId.next_id),
+                                                           else_=start) + count))
+            if result.rowcount > 0:
+                end = session.execute(select(NextId.next_id).where(NextId.repo_name == repo_name)).scalar_one()
+                return range(end - count, end)
+
+        self._logger.info(f"Creating ID counter for '{repo_name}' starting at {start}")
+        # Raises an IntegrityError if the counter was created concurrently, as repository names are unique
+        with self._session() as session, session.begin():
+            session.add(NextId(repo_name=repo_name, next_id=start + count))
+        return range(start, start + count)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, inspect, text
 
 from database.Base import Base
 
@@ -6,5 +6,24 @@ from database.Base import Base
 class NextId(Base):
     __tablename__ = 'nextids'
     id = Column(Integer,primary_key=True)
-    repo_name = Column(String(50))
+    repo_name = Column(String(50), unique=True, index=True, nullable=False)
     next_id = Column(Integer)
+
+
+def add_unique_repo_names(bind) -> None:
+    """
+    Add the unique index on the repository names to a counter table created before it existed.
+
+    `create_all` does not change existing tables. Of duplicate counters of a repository, only the highest is kept. The
+    NOT NULL constraint is not added to existing tables, as SQLite cannot alter columns. Counters without a repository
+    name are never used.
+    """
+    if not inspect(bind).has_table(NextId.__tablename__):
+        return
+    with bind.begin() as connection:
+        connection.execute(text(
+            "DELETE FROM nextids WHERE EXISTS (SELECT 1 FROM nextids other "
+            "WHERE other.repo_name = nextids.repo_name "
+            "AND (COALESCE(other.next_id, 0) > COALESCE(nextids.next_id, 0) "
+            "OR (COALESCE(other.next_id, 0) = COALESCE(nextids.next_id, 0) AND other.id > nextids.id)))"))
+        connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_nextids_repo_name ON nextids (repo_name)"))
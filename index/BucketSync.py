@@ -0,0 +1,158 @@
+import base64
+import hashlib
+import json
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+
+def md5(data: bytes) -> str:
+    # Same encoding as the md5_hash of Google Cloud Storage blobs
+    return base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+
+
+def _status_code(e: Exception) -> Optional[int]:
+    # Google API exceptions carry the HTTP status in `code`
+    return getattr(e, "code", None)
+
+
+class IndexConflictError(RuntimeError):
+    """
+    The index in the bucket has been changed by someone else since it was loaded
+    """
+
+
+class BucketSync:
+    """
+    Synchronises the files of an index with a Google Cloud Storage bucket.
+
+    The bucket contains a manifest with the MD5 hash, size, blob name and blob generation of every index file. Pushing
+    only uploads files whose hash changed and deletes blobs that are no longer part of the index, so a commit that adds
+    a segment only moves that segment. Every upload gets a new blob name, so no blob that another manifest may refer
+    to is ever overwritten. The manifest is written last and only if nobody else has written it since it was loaded.
+    If that fails, the blobs uploaded for it are deleted again.
+
+    Downloads request the blob generation listed in the manifest, so files of two versions of the index are never
+    mixed. If a file has been replaced in the meantime, the download fails instead.
+
+    Works with any bucket implementing the used subset of the `google.cloud.storage.Bucket` API, e.g. `LocalBucket`.
+    """
+    MANIFEST = "index-manifest.json"
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, bucket, workers: int = 8):
+        """
+        :param bucket: The bucket to store the index in
+        :param workers: Number of concurrent up- and downloads
+        """
+        self.bucket = bucket
+        self.workers = max(1, workers)
+        self.remote: Dict[str, Dict] = {}
+        """
+        Manifest entries of the files in the bucket by their name as of the last load or push
+        """
+        self.generation = 0
+        """
+        Generation of the manifest as of the last load or push. 0 if there is none.
+        """
+
+    def load(self) -> Dict[str, Dict]:
+        """
+        Read the manifest from the bucket.
+
+        :return: Manifest entries by file name. Empty if the bucket contains no index.
+        """
+        self.remote = {}
+        self.generation = 0
+
+        manifest = self.bucket.get_blob(self.MANIFEST)
+        if manifest is None:
+            self._logger.info("No index manifest found in bucket")
+            return self.remote
+
+        self.remote = json.loads(manifest.download_as_bytes().decode("utf-8"))["files"]
+        self.generation = manifest.generation
+        return self.remote
+
+    def download(self, names: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        """
+        Download files of the loaded manifest in parallel.
+
+        :param names: Names of the files
+        :return: Name and content of the files in the given order
+        """
+        names = list(names)
+
+        def download(name: str) -> bytes:
+            self._logger.debug("Downloading blob %s", name)
+            entry = self.remote[name]
+            # Manifests written before blob names were unique do not contain the name
+            return self.bucket.blob(entry.get("blob", name), generation=entry["generation"]).download_as_bytes()
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            yield from zip(names, pool.map(download, names))
+
+    def push(self, hashes: Dict[str, str], read: Callable[[str], bytes], keep: Set[str] = frozenset()) -> None:
+        """
+        Upload the changed files and the manifest, then delete files no longer part of the index.
+
+        :param hashes: MD5 hash of every local file of the index by name
+        :param read: Returns the content of a local file
+        :param keep: Names of files in the bucket that are still part of the index without being local
+        :raises IndexConflictError: If the index in the bucket has been changed since it was loaded
+        """
+        uploads = [name for name, digest in hashes.items()
+                   if name not in self.remote or self.remote[name]["md5"] != digest]
+        obsolete = [name for name in self.remote.keys() if name not in hashes and name not in keep]
+        # Blobs of removed and of replaced files
+        unreferenced = [self.remote[name].get("blob", name) for name in obsolete + uploads if name in self.remote]
+
+        uploaded_blobs = []
+        uploaded_lock = threading.Lock()
+
+        def upload(name: str) -> Dict:
+            data = read(name)
+            blob_name = f"{name}.{uuid.uuid4().hex}"
+            self._logger.debug("Saving file %s as %s", name, blob_name)
+            blob = self.bucket.blob(blob_name)
+            blob.upload_from_string(data, if_generation_match=0)
+            with uploaded_lock:
+                uploaded_blobs.append(blob_name)
+            return {"md5": md5(data), "size": len(data), "blob": blob_name, "generation": blob.generation}
+
+        try:
+            with ThreadPoolExecutor(self.workers) as pool:
+                uploaded = dict(zip(uploads, pool.map(upload, uploads)))
+
+            remote = {name: entry for name, entry in self.remote.items() if name not in obsolete}
+            remote.update(uploaded)
+
+            manifest = self.bucket.blob(self.MANIFEST)
+            manifest.upload_from_string(json.dumps({"files": remote}, sort_keys=True).encode("utf-8"),
+                                        if_generation_match=self.generation)
+        except Exception as e:
+            # No manifest refers to the new blobs
+            self._delete(uploaded_blobs)
+            if _status_code(e) == 412:
+                raise IndexConflictError("The index in the bucket has been changed by someone else "
+                                         "since it was loaded.") from e
+            raise
+        self.generation = manifest.generation
+        self.remote = remote
+
+        # Only delete blobs after the new manifest no longer refers to them
+        self._delete(unreferenced)
+
+        self._logger.info(f"Saved index to bucket: {len(uploaded)} files uploaded, {len(obsolete)} deleted")
+
+    def _delete(self, blob_names: Iterable[str]) -> None:
+        for name in blob_names:
+            self._logger.debug("Deleting blob %s", name)
+            try:
+                self.bucket.delete_blob(name)
+            except Exception as e:
+                if _status_code(e) != 404:
+                    raise
@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, Tuple
+
+import whoosh.filedb.filestore
+
+from index.BucketSync import BucketSync, md5
+from index.ExtendedStorage import ExtendedStorage
+from utils.files import atomic_write
+
+
+class CachedBucketStorage(ExtendedStorage, whoosh.filedb.filestore.FileStorage):
+    """
+    Index in a local directory that mirrors a Google Cloud Storage bucket synchronised by `BucketSync`.
+
+    Index files are read from disk and memory mapped by whoosh. Loading only downloads files whose hash differs from
+    the local copy, so an instance that is restarted on the same persistent disk only fetches the segments committed in
+    the meantime. On App Engine standard, `/tmp` is kept in memory and is lost on restart, so there the whole index is
+    downloaded on every start and held in memory. Point the cache directory to a persistent disk where one is
+    available.
+    """
+    STATE = ".bucket-cache.json"
+    """
+    Hashes of the local files, so unchanged files do not have to be hashed again on every sync
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, bucket, path: str, workers: int = 8):
+        """
+        :param bucket: The bucket to store the index in
+        :param path: Directory to cache the index in
+        :param workers: Number of concurrent up- and downloads
+        """
+        os.makedirs(path, exist_ok=True)
+        super().__init__(path)
+        self.sync = BucketSync(bucket, workers)
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+        """
+        Modification time, size and MD5 hash by name of the local files
+        """
+        self._sync_lock = threading.RLock()
+        self._load_state()
+
+    def load(self) -> None:
+        with self._sync_lock:
+            remote = self.sync.load()
+            local = self._local_hashes()
+
+            downloads = [name for name, entry in remote.items() if local.get(name) != entry["md5"]]
+            for name, data in self.sync.download(downloads):
+                # Readers keep their memory map of a replaced file
+                with atomic_write(self._fpath(name)) as f:
+                    f.write(data)
+                stat = os.stat(self._fpath(name))
+                self._hashes[name] = (stat.st_mtime_ns, stat.st_size, remote[name]["md5"])
+
+            for name in local.keys() - remote.keys():
+                self._logger.debug("Deleting cached file %s", name)
+                os.remove(self._fpath(name))
+                self._hashes.pop(name, None)
+
+            self._logger.info(f"Loaded index from bucket: {len(downloads)} files downloaded, "
+                              f"{len(remote) - len(downloads)} cached files reused")
+            self._save_state()
+
+    def save(self) -> None:
+        with self._sync_lock:
+            self.sync.push(self._local_hashes(), self._read)
+            self._save_state()
+
+    def clean(self, ignore=False):
+        with self._sync_lock:
+            self._hashes = {}
+            super().clean(ignore)
+
+    def _read(self, name: str) -> bytes:
+        with open(self._fpath(name), "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def _is_index_file(name: str) -> bool:
+        return name != CachedBucketStorage.STATE and not name.endswith((".tmp", "LOCK"))
+
+    def _local_hashes(self) -> Dict[str, str]:
+        """
+        :return: MD5 hash of every local index file by name. Only files changed since they were last hashed are read.
+        """
+        hashes = {}
+        for name in self.list():
+            if not self._is_index_file(name):
+                continue
+            stat = os.stat(self._fpath(name))
+            known = self._hashes.get(name)
+            if known is None or known[:2] != (stat.st_mtime_ns, stat.st_size):
+                known = (stat.st_mtime_ns, stat.st_size, md5(self._read(name)))
+                self._hashes[name] = known
+            hashes[name] = known[2]
+        self._hashes = {name: self._hashes[name] for name in hashes.keys()}
+        return hashes
+
+    def _load_state(self) -> None:
+        try:
+            with open(self._fpath(self.STATE), "r") as f:
+                self._hashes = {name: tuple(entry) for name, entry in json.load(f).items()}
+        except (OSError, ValueError):
+            self._hashes = {}
+
+    def _save_state(self) -> None:
+        with atomic_write(self._fpath(self.STATE), "w") as f:
+            json.dump(self._hashes, f)
@@ -0,0 +1,136 @@
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import networkx
+
+from ontology.ReachabilityIndex import ReachabilityIndex
+from ontology.style import NODE_PROPS, relation_colour
+
+
+@dataclass
+class IndexedEntity:
+    id: str
+    label: str
+    parent: Optional[str]
+    """
+    Label of the parent
+    """
+    relations: List[Tuple[str, str]]
+    """
+    Pairs of relation name and label of the target
+    """
+
+
+def _normalise_id(class_id) -> str:
+    return str(class_id or "").strip().replace(":", "_")
+
+
+class EntityGraph:
+    """
+    Graph of the entities of all indexed spreadsheets of a repository.
+
+    The graph is kept up to date together with the search index, so it includes unreleased entities and is available
+    without downloading the release. Parents and relation targets are resolved by label across all sheets, like the
+    graph of a `SheetOverlay`. Entities are replaced sheet by sheet. The networkx graph and its reachability index are
+    only rebuilt when first needed after a change.
+
+    All IDs are stored in the form `PREFIX_NUMBER`.
+    """
+
+    def __init__(self):
+        self._sheets: Dict[str, Dict[str, IndexedEntity]] = {}
+        """
+        Entities by their ID by spreadsheet
+        """
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Tuple[networkx.MultiDiGraph, ReachabilityIndex]] = None
+
+    @staticmethod
+    def entity(fields: Dict) -> Optional[IndexedEntity]:
+        """
+        :param fields: Stored fields of a document in the index
+        :return: The entity described by the document or `None` if it has no ID
+        """
+        class_id = _normalise_id(fields.get("class_id"))
+        if not class_id:
+            return None
+        parent = re.sub("[\\[].*?[\\]]", "", str(fields.get("parent") or "")).strip()
+        return IndexedEntity(class_id,
+                             str(fields.get("label") or "").strip(),
+                             parent or None,
+                             [(rel, str(target).strip()) for rel, target in fields.get("relation_targets") or ()])
+
+    def replace_sheet(self, spreadsheet: str, entities: Iterable[IndexedEntity]) -> None:
+        """
+        Replace all entities of a spreadsheet.
+        """
+        with self._lock:
+            self._sheets[spreadsheet] = {e.id: e for e in entities}
+            self._snapshot = None
+
+    def remove_sheet(self, spreadsheet: str) -> None:
+        with self._lock:
+            if self._sheets.pop(spreadsheet, None) is not None:
+                self._snapshot = None
+
+    @property
+    def graph(self) -> networkx.MultiDiGraph:
+        return self._get_snapshot()[0]
+
+    @property
+    def reachability(self) -> ReachabilityIndex:
+        """
+        Reachability along all edges of the graph
+        """
+        return self._get_snapshot()[1]
+
+    def _get_snapshot(self) -> Tuple[networkx.MultiDiGraph, ReachabilityIndex]:
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._build()
+            return self._snapshot
+
+    def _build(self) -> Tuple[networkx.MultiDiGraph, ReachabilityIndex]:
+        graph = networkx.MultiDiGraph()
+        label_to_id: Dict[str, str] = {}
+        entities = [e for sheet in self._sheets.values() for e in sheet.values()]
+        for entity in entities:
+            if entity.label:
+                label_to_id[entity.label] = entity.id
+            graph.add_node(entity.id, label=entity.label.replace(" ", "\n"), **NODE_PROPS)
+
+        for entity in entities:
+            parent = label_to_id.get(entity.parent) if entity.parent else None
+            if parent is not None:
+                # Subclass relations must be reversed for layout
+                graph.add_edge(parent, entity.id, dir="back")
+            for rel_name, target_label in entity.relations:
+                target = label_to_id.get(target_label)
+                if target is not None:
+                    graph.add_edge(entity.id, target, color=relation_colour(rel_name), label=rel_name)
+
+        return graph, ReachabilityIndex(graph.nodes, graph.edges())
+
+    def related_ids(self, class_ids: Iterable[str]) -> List[str]:
+        """
+        :param class_ids: IDs of the entities. Both `PREFIX:NUMBER` and `PREFIX_NUMBER` are accepted.
+        :return: The entities, their parents and everything reachable from them, in the order they were found
+        """
+        graph, reachability = self._get_snapshot()
+        seeds = [i for i in (_normalise_id(c) for c in class_ids) if i]
+
+        ids = dict.fromkeys(seeds)  # Used as an insertion ordered set
+        for seed in seeds:
+            if seed in graph:
+                ids.update(dict.fromkeys(s for s, _, attrs in graph.in_edges(seed, data=True)
+                                         if attrs.get("dir") == "back"))
+        ids.update(dict.fromkeys(reachability.descendants(seeds)))
+        return list(ids)
+
+    def subgraph(self, ids: Iterable[str]) -> networkx.MultiDiGraph:
+        """
+        :return: Read-only view of the graph induced by the given nodes
+        """
+        return self.graph.subgraph(ids)
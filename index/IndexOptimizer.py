@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from whoosh.reading import SegmentReader
+
+
+def merge_smallest(count: int) -> Callable:
+    """
+    Merge policy for `writer.commit(mergetype=...)` that merges the smallest segments of the index into one.
+
+    :param count: Number of segments to merge
+    """
+
+    def merge(writer, segments: List) -> List:
+        ordered = sorted(segments, key=lambda s: s.doc_count_all())
+        for segment in ordered[:count]:
+            writer.add_reader(SegmentReader(writer.storage, writer.schema, segment))
+        return ordered[count:]
+
+    return merge
+
+
+class IndexOptimizer:
+    """
+    Merges the segments of the index into one in a background thread.
+
+    Regular commits only merge small segments, so they stay fast regardless of the size of the index. Segments still
+    accumulate over time and slow down searches. The optimizer merges all segments once their number exceeds a
+    threshold after a commit, and additionally at a fixed interval.
+    """
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, optimize: Callable[[], None], segment_count: Callable[[], int],
+                 max_segments: int = 10, interval: float = 0):
+        """
+        :param optimize: Merges the segments of the index into one
+        :param segment_count: Returns the current number of segments of the index
+        :param max_segments: Optimize after a commit that leaves more segments than this
+        :param interval: Seconds between scheduled optimizations. Disabled if 0.
+        """
+        self.max_segments = max(1, max_segments)
+        self.interval = interval
+        self._optimize = optimize
+        self._segment_count = segment_count
+        self._requested = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.runs = 0
+        self.last_run: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="index-optimizer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._requested.set()
+
+    def committed(self) -> None:
+        """
+        Notify the optimizer about a commit. Schedules an optimization if there are too many segments.
+        """
+        count = self._segment_count()
+        if count > self.max_segments:
+            self._logger.debug(f"Index has {count} segments. Scheduling optimization.")
+            self._requested.set()
+
+    def request(self) -> None:
+        """
+        Schedule an optimization regardless of the number of segments.
+        """
+        self._requested.set()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "segments": self._segment_count(),
+            "max_segments": self.max_segments,
+            "optimizations": self.runs,
+            "last_optimization": self.last_run,
+            "last_optimization_duration": self.last_duration,
+            "last_optimization_error": self.last_error,
+        }
+
+    def _run(self) -> None:
+        while True:
+            self._requested.wait(self.interval if self.interval > 0 else None)
+            self._requested.clear()
+            if self._stopped:
+                return
+            if self._segment_count() <= 1:
+                continue
+
+            start = time.time()
+            try:
+                self._optimize()
+                self.last_error = None
+            except Exception as e:
+                self._logger.error(f"Failed to optimize the index: {e}")
+                self.last_error = str(e)
+            self.runs += 1
+            self.last_run = time.time()
+            self.last_duration = self.last_run - start
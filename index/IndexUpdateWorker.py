@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+@dataclass
+class SheetUpdate:
+    """
+    New content of a spreadsheet to write to the index
+    """
+    repo_name: str
+    folder: str
+    sheet_name: str
+    header: List[str]
+    sheet_data: List[Dict[str, Any]]
+    """
+    Rows as sent by the edit page, including the ID column added by Tabulator
+    """
+    sha: Optional[str] = None
+    """
+    Blob SHA of the saved version, if known
+    """
+    submitted: float = field(default_factory=time.time)
+
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        return self.repo_name, self.folder, self.sheet_name
+
+
+class IndexUpdateWorker:
+    """
+    Writes saved spreadsheets to the index in a single background thread.
+
+    Updates are queued by sheet. If a sheet is saved again before its previous update has been written, only the
+    latest content is kept. The worker waits a short moment to collect updates and writes up to `batch_size` sheets
+    with one commit.
+    """
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, apply: Callable[[List[SheetUpdate]], None], batch_size: int = 20, delay: float = 1.0):
+        """
+        :param apply: Writes a batch of updates to the index with a single commit
+        :param batch_size: Maximum number of sheets written with one commit
+        :param delay: Seconds to wait for further updates before writing
+        """
+        self.batch_size = max(1, batch_size)
+        self.delay = delay
+        self._apply = apply
+        self._condition = threading.Condition()
+        self._pending: Dict[Tuple[str, str, str], SheetUpdate] = {}  # Insertion ordered, oldest first
+        self._running = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+        self.processed = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+        self.last_commit: Optional[float] = None
+
+    def start(self) -> None:
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="index-update-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the worker after the pending updates have been written.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def submit(self, update: SheetUpdate) -> None:
+        """
+        Queue an update. A pending update of the same sheet is replaced, but keeps its place and submission time.
+        """
+        with self._condition:
+            previous = self._pending.get(update.key)
+            if previous is not None:
+                update.submitted = previous.submitted
+                self.coalesced += 1
+            self._pending[update.key] = update
+            self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all queued updates have been written.
+
+        :return: False if the timeout passed first
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._running, timeout)
+
+    def status(self) -> Dict[str, Any]:
+        """
+        :return: Queue depth, lag in seconds of the oldest pending update and counters
+        """
+        with self._condition:
+            oldest = min((u.submitted for u in self._pending.values()), default=None)
+            return {
+                "queue_depth": len(self._pending),
+                "in_progress": self._running,
+                "lag_seconds": time.time() - oldest if oldest is not None else 0.0,
+                "processed": self.processed,
+                "coalesced": self.coalesced,
+                "batches": self.batches,
+                "failed": self.failed,
+                "last_commit": self.last_commit,
+                "last_error": self.last_error,
+            }
+
+    def _take_batch(self) -> List[SheetUpdate]:
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending or self._stopped)
+            if not self._pending:
+                return []
+
+        # Give concurrent saves a moment to arrive, so they end up in the same commit
+        if self.delay > 0:
+            time.sleep(self.delay)
+
+        with self._condition:
+            keys = list(self._pending.keys())[:self.batch_size]
+            batch = [self._pending.pop(key) for key in keys]
+            self._running = len(batch)
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+
+            self._logger.debug(f"Writing {len(batch)} sheets to the index")
+            try:
+                self._apply(batch)
+                error = None
+            except Exception as e:
+                self._logger.error(f"Failed to update the index for {[u.key for u in batch]}: {e}")
+                error = str(e)
+
+            with self._condition:
+                self.batches += 1
+                if error is None:
+                    self.processed += len(batch)
+                    self.last_commit = time.time()
+                else:
+                    self.failed += len(batch)
+                    self.last_error = error
+                self._running = 0
+                self._condition.notify_all()
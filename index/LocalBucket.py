@@ -0,0 +1,145 @@
+import base64
+import hashlib
+import os
+import threading
+from typing import Dict, Iterator, Optional, Tuple
+
+from utils.files import atomic_write
+
+
+class BucketError(Exception):
+    """
+    Error with an HTTP status code like the exceptions of the Google API client
+    """
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class LocalBlob:
+    """
+    A versioned file in a `LocalBucket`. Mimics `google.cloud.storage.Blob`.
+    """
+
+    def __init__(self, bucket: "LocalBucket", name: str, generation: Optional[int] = None):
+        self.bucket = bucket
+        self.name = name
+        self.generation = generation
+        self.md5_hash: Optional[str] = None
+        self.size: Optional[int] = None
+
+    def exists(self) -> bool:
+        return self.bucket._current(self.name) is not None
+
+    def reload(self) -> None:
+        current = self.bucket._current(self.name)
+        if current is None:
+            raise BucketError(404, f"No such object: {self.name}")
+        self.generation = current
+        data = self.bucket._read(self.name, current)
+        self.md5_hash = base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+        self.size = len(data)
+
+    def upload_from_string(self, data, content_type: Optional[str] = None,
+                           if_generation_match: Optional[int] = None) -> None:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.generation = self.bucket._write(self.name, data, if_generation_match)
+        self.md5_hash = base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+        self.size = len(data)
+
+    def download_as_bytes(self) -> bytes:
+        generation = self.generation if self.generation is not None else self.bucket._current(self.name)
+        if generation is None:
+            raise BucketError(404, f"No such object: {self.name}")
+        return self.bucket._read(self.name, generation)
+
+
+class LocalBucket:
+    """
+    Bucket in a local directory for development and testing without Google Cloud.
+
+    Implements the subset of the `google.cloud.storage.Bucket` API used by `BucketSync`, including object
+    generations and generation preconditions. Used instead of Google Cloud Storage if `INDEX_BUCKET_PATH` is set.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Directory to store the objects in. Several instances in the same process can share a directory.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def blob(self, name: str, generation: Optional[int] = None) -> LocalBlob:
+        return LocalBlob(self, name, generation)
+
+    def get_blob(self, name: str) -> Optional[LocalBlob]:
+        if self._current(name) is None:
+            return None
+        blob = LocalBlob(self, name)
+        blob.reload()
+        return blob
+
+    def list_blobs(self) -> Iterator[LocalBlob]:
+        for name in sorted(self._generations().keys()):
+            blob = self.get_blob(name)
+            if blob is not None:
+                yield blob
+
+    def delete_blob(self, name: str) -> None:
+        with self._lock:
+            if name not in self._generations():
+                raise BucketError(404, f"No such object: {name}")
+            self._remove(name)
+
+    def _file(self, name: str, generation: int) -> str:
+        return os.path.join(self.path, f"{name.replace('/', '%2F')}#{generation}")
+
+    @staticmethod
+    def _parse(entry: str) -> Tuple[Optional[str], int]:
+        name, _, generation = entry.rpartition("#")
+        if not name or not generation.isdigit():
+            return None, 0
+        return name.replace("%2F", "/"), int(generation)
+
+    def _generations(self) -> Dict[str, int]:
+        # The directory is the only state, so instances sharing it see each other's changes
+        generations = {}
+        for entry in os.listdir(self.path):
+            name, generation = self._parse(entry)
+            if name is not None:
+                generations[name] = max(generations.get(name, 0), generation)
+        return generations
+
+    def _remove(self, name: str, keep: Optional[int] = None) -> None:
+        for entry in os.listdir(self.path):
+            if self._parse(entry) == (name, keep):
+                continue
+            if self._parse(entry)[0] == name:
+                os.remove(os.path.join(self.path, entry))
+
+    def _current(self, name: str) -> Optional[int]:
+        return self._generations().get(name)
+
+    def _read(self, name: str, generation: int) -> bytes:
+        try:
+            with open(self._file(name, generation), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise BucketError(404, f"No such object: {name}#{generation}")
+
+    def _write(self, name: str, data: bytes, if_generation_match: Optional[int]) -> int:
+        with self._lock:
+            generations = self._generations()
+            current = generations.get(name, 0)
+            if if_generation_match is not None and if_generation_match != current:
+                raise BucketError(412, f"Precondition failed for {name}: generation {current}")
+
+            generation = max(generations.values(), default=0) + 1
+            with atomic_write(self._file(name, generation)) as f:
+                f.write(data)
+            # Like a bucket without versioning, only the latest generation is kept
+            self._remove(name, keep=generation)
+            return generation
@@ -0,0 +1,86 @@
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from whoosh.index import Index
+from whoosh.searching import Searcher
+
+
+class SearcherPool:
+    """
+    Searchers on a long-lived index, shared between requests.
+
+    A searcher is used by one thread at a time. When it is checked out and the index has been committed to in the
+    meantime, it is refreshed, which only opens the segments that changed. Searches that are running during a commit
+    keep the segments they started with, so a commit never makes a running search fail.
+    """
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, index: Index):
+        """
+        :param index: The open index to search. It is closed by the pool.
+        """
+        self._lock = threading.Lock()
+        self._index = index
+        self._idle: List[Searcher] = []
+        self._generation = 0
+
+    @property
+    def index(self) -> Index:
+        return self._index
+
+    @contextmanager
+    def searcher(self) -> Iterator[Searcher]:
+        """
+        Check out a searcher on the latest version of the index for the duration of the `with` block.
+        """
+        with self._lock:
+            generation = self._generation
+            searcher = self._idle.pop() if self._idle else None
+            index = self._index
+
+        if searcher is None:
+            searcher = index.searcher()
+        else:
+            searcher = searcher.refresh()
+
+        try:
+            yield searcher
+        finally:
+            with self._lock:
+                if generation == self._generation:
+                    self._idle.append(searcher)
+                    searcher = None
+            if searcher is not None:
+                # The index has been replaced while the searcher was in use
+                searcher.close()
+
+    def reset(self, index: Index) -> None:
+        """
+        Replace the index, e.g. after it has been rebuilt.
+
+        Idle searchers on the old index are closed immediately, searchers in use when they are returned.
+
+        :param index: The new open index
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+            old_index, self._index = self._index, index
+            self._generation += 1
+
+        for searcher in idle:
+            searcher.close()
+        if old_index is not index:
+            old_index.close()
+
+    def close(self) -> None:
+        """
+        Close all idle searchers and the index.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for searcher in idle:
+            searcher.close()
+        self._index.close()
@@ -0,0 +1,69 @@
+import json
+import logging
+from typing import Dict, Optional
+
+from whoosh.filedb.filestore import Storage
+
+
+class SheetManifest:
+    """
+    Blob SHAs of all spreadsheets in the index.
+
+    The manifest is stored as a file next to the index in the same storage, so it is saved and loaded together with
+    the index. A sheet only has to be indexed again if its SHA in the repository differs from the one in the manifest.
+    """
+    FILENAME = "sheets_manifest.json"
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, storage: Storage):
+        """
+        :param storage: Storage of the index
+        """
+        self.storage = storage
+        self.sheets: Dict[str, Dict[str, str]] = {}
+        """
+        SHA of the indexed version by path of the sheet by short name of the repository
+        """
+
+    def exists(self) -> bool:
+        return self.storage.file_exists(self.FILENAME)
+
+    def load(self) -> "SheetManifest":
+        """
+        Read the manifest from the storage. A missing or unreadable manifest is treated as empty.
+        """
+        self.sheets = {}
+        if not self.exists():
+            return self
+
+        try:
+            with self.storage.open_file(self.FILENAME) as f:
+                self.sheets = json.loads(f.read().decode("utf-8"))
+        except ValueError as e:
+            self._logger.warning(f"Could not read sheet manifest: {e}")
+
+        return self
+
+    def save(self) -> None:
+        """
+        Write the manifest to the storage.
+        """
+        with self.storage.create_file(self.FILENAME) as f:
+            f.write(json.dumps(self.sheets, sort_keys=True).encode("utf-8"))
+
+    def get(self, repository_key: str) -> Dict[str, str]:
+        """
+        :return: SHA by path of all indexed sheets of the repository
+        """
+        return dict(self.sheets.get(repository_key, {}))
+
+    def set(self, repository_key: str, path: str, sha: Optional[str]) -> None:
+        """
+        Record the indexed version of a sheet. A SHA of `None` removes the sheet from the manifest.
+        """
+        sheets = self.sheets.setdefault(repository_key, {})
+        if sha is None:
+            sheets.pop(path, None)
+        else:
+            sheets[path] = sha
@@ -0,0 +1,120 @@
+import logging
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+from utils.github import parse_spreadsheet
+
+Job = TypeVar("Job")
+
+ParsedSheet = Tuple[List[Dict[str, str]], List[str]]
+"""
+Rows and header of a parsed spreadsheet
+"""
+
+
+class SheetPipeline(Generic[Job]):
+    """
+    Downloads and parses spreadsheets concurrently and hands them to a single consumer.
+
+    Downloads run in a pool of threads. Parsing with openpyxl is CPU-bound and runs in a pool of processes. Parsed
+    sheets are passed through a bounded queue to the consumer, which runs in the calling thread, e.g. to add them to
+    an index with a single writer. If the consumer falls behind, the workers block until there is room in the queue,
+    so only a bounded number of sheets is held in memory.
+    """
+    MIN_PROCESS_JOBS = 8
+    """
+    Fewer sheets are parsed in the download threads, as starting the processes takes longer than parsing a few sheets
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, download_workers: int, parse_processes: int, queue_size: int):
+        """
+        :param download_workers: Number of concurrent downloads
+        :param parse_processes: Number of processes parsing sheets. With 0 or fewer than `MIN_PROCESS_JOBS` sheets,
+            sheets are parsed in the download threads.
+        :param queue_size: Maximum number of parsed sheets waiting for the consumer
+        """
+        self.download_workers = max(1, download_workers)
+        self.parse_processes = max(0, parse_processes)
+        self.queue_size = max(1, queue_size)
+
+    def run(self,
+            jobs: Iterable[Job],
+            fetch: Callable[[Job], Tuple[str, bytes]],
+            consume: Callable[[Job, str, ParsedSheet], None]) -> List[Job]:
+        """
+        Download, parse and consume all jobs.
+
+        Jobs that fail to download or parse are logged and skipped. Exceptions of the consumer are raised.
+
+        :param jobs: Sheets to process
+        :param fetch: Downloads a sheet and returns its SHA and content. Called in worker threads.
+        :param consume: Called with the job, the SHA and the parsed sheet. Called in the calling thread.
+        :return: The jobs that failed
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return []
+
+        results: "queue.Queue[Tuple[Job, Optional[str], Optional[ParsedSheet], Optional[Exception]]]" = \
+            queue.Queue(maxsize=self.queue_size)
+        parse_pool: Optional[Executor] = None
+        if self.parse_processes and len(jobs) >= self.MIN_PROCESS_JOBS:
+            # Forking a process with running threads (e.g. the index refresher) can deadlock the child
+            parse_pool = ProcessPoolExecutor(self.parse_processes, mp_context=multiprocessing.get_context("spawn"))
+
+        cancelled = threading.Event()
+
+        def put(item) -> None:
+            # Block while the queue is full, unless the consumer gave up
+            while not cancelled.is_set():
+                try:
+                    results.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    pass
+
+        def process(job: Job) -> None:
+            if cancelled.is_set():
+                return
+            try:
+                sha, data = fetch(job)
+                if parse_pool is not None:
+                    parsed = parse_pool.submit(parse_spreadsheet, data, str(job)).result()
+                else:
+                    parsed = parse_spreadsheet(data, str(job))
+                put((job, sha, parsed, None))
+            except Exception as e:
+                put((job, None, None, e))
+
+        failed = []
+        download_pool = ThreadPoolExecutor(self.download_workers, thread_name_prefix="sheet-pipeline")
+        futures = []
+        try:
+            for job in jobs:
+                futures.append(download_pool.submit(process, job))
+
+            for _ in range(len(jobs)):
+                job, sha, parsed, error = results.get()
+                if error is not None:
+                    self._logger.error(f"Could not download or parse {job}: {error}")
+                    failed.append(job)
+                    continue
+
+                consume(job, sha, parsed)
+        except BaseException:
+            cancelled.set()
+            raise
+        finally:
+            # Jobs that have not started yet are dropped
+            for future in futures:
+                future.cancel()
+            download_pool.shutdown()
+            if parse_pool is not None:
+                parse_pool.shutdown()
+
+        return failed
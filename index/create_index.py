@@ -1,10 +1,10 @@
 import io
 import logging
-from typing import List, Tuple, Union, Dict
+import re
+from typing import List, Optional, Tuple, Union, Dict
 
 import openpyxl
-from whoosh.index import FileIndex
-from whoosh.qparser import MultifieldParser
+from whoosh.query import And, Term
 from whoosh.writing import SegmentWriter
 
 _logger = logging.getLogger(__name__)
@@ -47,20 +47,15 @@ def parse_input_sheet(file: Union[str, bytes, io.BytesIO]) -> List[EntityData]:
     return [(header, [i.value for i in row]) for row in data]
 
 
-def re_write_entity_data_set(repo_name: str, index: FileIndex, sheet_name: str, entity_data: List[EntityData]):
-    writer = index.writer(timeout=60)  # Wait 60s for the writer lock
-    mparser = MultifieldParser(["repo", "spreadsheet"],
-                               schema=index.schema)
-    writer.delete_by_query(mparser.parse("repo:" + repo_name + " AND spreadsheet:" + sheet_name))
-    writer.commit()
-    writer = index.writer(timeout=60)  # Wait 60s for the writer lock
-    for data in entity_data:
-        add_entity_data_to_index(data, repo_name, sheet_name, writer)
+def delete_sheet_from_index(repo_name: str, sheet_name: str, writer: SegmentWriter):
+    writer.delete_by_query(And([Term("repo", repo_name), Term("spreadsheet", sheet_name)]))
 
-    writer.commit(optimize=True)
 
-
-def add_entity_data_to_index(entity_data: EntityData, repo_name: str, sheet_name: str, writer: SegmentWriter):
+def add_entity_data_to_index(entity_data: EntityData, repo_name: str, sheet_name: str,
+                             writer: SegmentWriter) -> Optional[Dict]:
+    """
+    :return: The fields of the added document or `None` if the row has no ID, label, definition or parent
+    """
     header, rowdata = entity_data
 
     _logger.debug(f"Adding entity data '{entity_data[1][0]}' to index for repository '{repo_name}' and sheet '{sheet_name}'")
@@ -85,11 +80,43 @@ def add_entity_data_to_index(entity_data: EntityData, repo_name: str, sheet_name
         to_be_reviewed_by = rowdata[header.index("To be reviewed by")]
     else:
         to_be_reviewed_by = None
+    if "Curation status" in header:
+        curation_status = rowdata[header.index("Curation status")]
+    else:
+        curation_status = None
+    if "Sub-ontology" in header:
+        sub_ontology = rowdata[header.index("Sub-ontology")]
+    else:
+        sub_ontology = None
+    targets = relation_targets(header, rowdata)
+    relations = list(dict.fromkeys(rel_name for rel_name, _ in targets))
     if class_id or label or definition or parent:
-        writer.add_document(repo=repo_name,
-                            spreadsheet=sheet_name,
-                            class_id=(class_id if class_id else None),
-                            label=(label if label else None),
-                            definition=(definition if definition else None),
-                            parent=(parent if parent else None),
-                            tobereviewedby=(to_be_reviewed_by if to_be_reviewed_by else None))
+        document = dict(repo=repo_name,
+                        spreadsheet=sheet_name,
+                        class_id=(class_id if class_id else None),
+                        label=(label if label else None),
+                        label_ngrams=(label if label else None),
+                        definition=(definition if definition else None),
+                        parent=(parent if parent else None),
+                        tobereviewedby=(to_be_reviewed_by if to_be_reviewed_by else None),
+                        curation_status=(str(curation_status).strip() if curation_status else None),
+                        sub_ontology=(str(sub_ontology).strip() if sub_ontology else None),
+                        relations=(",".join(relations) if relations else None),
+                        relation_targets=targets)
+        writer.add_document(**document)
+        return document
+    return None
+
+
+def relation_targets(header: List, rowdata: List) -> List[Tuple[str, str]]:
+    """
+    :return: Pairs of relation name and target label of the values of `REL 'name'` columns in the row. Several
+        targets in one column are separated by semicolons.
+    """
+    targets = []
+    for column, value in zip(header, rowdata):
+        if column and "REL" in str(column) and value is not None and str(value).strip():
+            match = re.search(r"'([^']+)'", str(column))
+            if match:
+                targets.extend((match.group(1), target.strip()) for target in str(value).split(";") if target.strip())
+    return targets
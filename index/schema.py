@@ -1,14 +1,37 @@
-from whoosh.fields import Schema, TEXT, KEYWORD, ID, SchemaClass
+from whoosh.fields import Schema, TEXT, KEYWORD, ID, NGRAMWORDS, STORED, SchemaClass
 from whoosh.formats import Existence, Positions, Frequency
 
+LABEL_NGRAM_MIN = 2
+LABEL_NGRAM_MAX = 12
+
+
 class OntologyContentSchema(SchemaClass):
     repo = ID(stored=True)
     spreadsheet = ID(stored=True)
     class_id = ID(stored=True)
     label = TEXT(stored=True)
+    label_ngrams = NGRAMWORDS(minsize=LABEL_NGRAM_MIN, maxsize=LABEL_NGRAM_MAX, at="start")
+    """
+    Prefixes of the words of the label for search as you type
+    """
     definition = TEXT(stored=True)
     parent = KEYWORD(stored=True)
     tobereviewedby = TEXT(stored=True)
+    curation_status = ID(stored=True, sortable=True)
+    sub_ontology = ID(stored=True, sortable=True)
+    relations = KEYWORD(stored=True, commas=True, scorable=False)
+    """
+    Names of the relations the entity has values for, separated by commas
+    """
+    relation_targets = STORED
+    """
+    Pairs of relation name and label of the target, e.g. for building the `EntityGraph`
+    """
 
 
 schema = OntologyContentSchema()
+
+FACETS = ["curation_status", "sub_ontology", "relations"]
+"""
+Fields that search results can be filtered and grouped by
+"""
@@ -0,0 +1,56 @@
+import bisect
+from typing import Dict, List, Tuple
+
+
+class LabelCompleter:
+    """
+    Autocompletion of class labels.
+
+    Labels are kept in an array sorted by their lower case form. Labels starting with a term are found by binary
+    search. Only if there are not enough of those, the remaining labels are scanned for the term anywhere in the label.
+    """
+
+    def __init__(self, label_to_id: Dict[str, str]):
+        """
+        :param label_to_id: IDs of the classes by their label
+        """
+        entries = sorted((label.lower(), label, class_id) for label, class_id in label_to_id.items() if label)
+        self._keys: List[str] = [key for key, _, _ in entries]
+        self._entries: List[Tuple[str, str]] = [(label, class_id) for _, label, class_id in entries]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def complete(self, term: str, limit: int = 10) -> List[Dict[str, str]]:
+        """
+        Find labels matching a term, ignoring case.
+
+        Labels starting with the term come first, followed by labels containing it. Both groups are sorted
+        alphabetically.
+
+        :param term: Text typed so far
+        :param limit: Maximum number of matches
+        :return: Label and ID of the matching classes
+        """
+        term = term.strip().lower()
+        if not term or limit <= 0:
+            return []
+
+        keys = self._keys
+        start = bisect.bisect_left(keys, term)
+        end = start
+        while end < len(keys) and end - start < limit and keys[end].startswith(term):
+            end += 1
+        indices = list(range(start, end))
+
+        if len(indices) < limit:
+            # All labels with the prefix are already included
+            for i, key in enumerate(keys):
+                if start <= i < end:
+                    continue
+                if term in key:
+                    indices.append(i)
+                    if len(indices) >= limit:
+                        break
+
+        return [{"label": self._entries[i][0], "id": self._entries[i][1]} for i in indices]
@@ -0,0 +1,70 @@
+from typing import Dict, Hashable, Iterable, List, Set, Tuple
+
+import networkx
+
+
+class ReachabilityIndex:
+    """
+    Precomputed transitive closure of a directed graph.
+
+    Strongly connected components are collapsed and numbered in topological order. For every component, the set of
+    components reachable from it is stored as a bitset in a python int. The descendants of any set of nodes are
+    then answered by or-ing their bitsets, without traversing the graph.
+    """
+
+    def __init__(self, nodes: Iterable[Hashable], edges: Iterable[Tuple[Hashable, Hashable]]):
+        """
+        :param nodes: All nodes of the graph
+        :param edges: Pairs of source and target nodes. Nodes only occurring in edges are added as well.
+        """
+        graph = networkx.DiGraph()
+        graph.add_nodes_from(nodes)
+        graph.add_edges_from(edges)
+
+        condensed = networkx.condensation(graph)
+        order = list(networkx.topological_sort(condensed))
+        position = {c: i for i, c in enumerate(order)}
+
+        self._component: Dict[Hashable, int] = {n: position[c] for n, c in condensed.graph["mapping"].items()}
+        self._members: List[Tuple[Hashable, ...]] = [tuple(condensed.nodes[c]["members"]) for c in order]
+
+        cyclic = set(self._component[n] for n in networkx.nodes_with_selfloops(graph))
+        closure = [0] * len(order)
+        # Successors come later in the topological order, so their closure is complete when it is needed
+        for i in reversed(range(len(order))):
+            bits = 1 << i if len(self._members[i]) > 1 or i in cyclic else 0
+            for successor in condensed.successors(order[i]):
+                j = position[successor]
+                bits |= (1 << j) | closure[j]
+            closure[i] = bits
+        self._closure = closure
+
+    def __contains__(self, node: Hashable) -> bool:
+        return node in self._component
+
+    def descendants(self, nodes: Iterable[Hashable]) -> Set[Hashable]:
+        """
+        All nodes reachable from any of the given nodes by following at least one edge.
+
+        The result may contain nodes of the query if they are reachable from another queried node or lie on a cycle.
+
+        :param nodes: Nodes to start from. Unknown nodes are ignored.
+        :return: The reachable nodes
+        """
+        bits = 0
+        for node in nodes:
+            i = self._component.get(node)
+            if i is not None:
+                bits |= self._closure[i]
+
+        result = set()
+        if not bits:
+            return result
+
+        # Reversed binary representation: the character at index i is bit i
+        flags = bin(bits)[:1:-1]
+        i = flags.find("1")
+        while i >= 0:
+            result.update(self._members[i])
+            i = flags.find("1", i + 1)
+        return result
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import pickle
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+
+from utils.files import atomic_write
+
+
+class ReleaseCache:
+    """
+    Persistent cache of parsed ontology releases.
+
+    Release files are downloaded with conditional requests. The ETag of the last download is stored on disk together
+    with a pickled snapshot of everything that was derived from the release file. As long as the release does not
+    change, it costs a single `304 Not Modified` round-trip and the snapshot is loaded from memory or disk instead of
+    being parsed again.
+    """
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, cache_dir: str, version: int = 1, session: Optional[requests.Session] = None):
+        """
+        :param cache_dir: Directory the snapshots are stored in
+        :param version: Format version of the snapshots. Snapshots stored with a different version are ignored.
+        :param session: Session to download release files with, e.g. to reuse connections
+        """
+        self.cache_dir = cache_dir
+        self.version = version
+        self.session = session if session is not None else requests.Session()
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, Tuple[str, Any]] = {}
+
+        if not os.path.exists(cache_dir):
+            self._logger.info("Release cache directory not found. Creating it.")
+            os.makedirs(cache_dir)
+
+    def get(self, key: str, url: str, build: Callable[[bytes], Any]) -> Any:
+        """
+        Get the snapshot of a release file.
+
+        The file is only downloaded and passed to `build` if it changed since the last call or if no snapshot is
+        cached.
+
+        :param key: Name under which the snapshot is cached, e.g. the short name of the repository
+        :param url: Location of the release file
+        :param build: Creates the snapshot from the content of the release file
+        :return: The snapshot of the current release
+        """
+        etag = self._read_etag(key)
+
+        headers = {"If-None-Match": etag} if etag is not None else {}
+        response = self.session.get(url, headers=headers)
+        if response.status_code == 304:
+            snapshot = self._load(key, etag)
+            if snapshot is not None:
+                self._logger.debug(f"Release '{key}' not modified. Using cached snapshot.")
+                return snapshot
+
+            # The snapshot vanished between reading the ETag and loading it. Fetch the file unconditionally.
+            response = self.session.get(url)
+        response.raise_for_status()
+
+        snapshot = build(response.content)
+        self._store(key, response.headers.get("ETag"), snapshot)
+
+        return snapshot
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _snapshot_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pickle")
+
+    def _read_etag(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._snapshots:
+                return self._snapshots[key][0]
+
+        try:
+            with open(self._meta_path(key)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if meta.get("version") != self.version or not os.path.exists(self._snapshot_path(key)):
+            return None
+
+        return meta.get("etag")
+
+    def _load(self, key: str, etag: str) -> Optional[Any]:
+        with self._lock:
+            if key in self._snapshots and self._snapshots[key][0] == etag:
+                return self._snapshots[key][1]
+
+        try:
+            with open(self._snapshot_path(key), "rb") as f:
+                stored_etag, snapshot = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError) as e:
+            self._logger.warning(f"Could not load cached snapshot of release '{key}': {e}")
+            return None
+
+        if stored_etag != etag:
+            return None
+
+        with self._lock:
+            self._snapshots[key] = (etag, snapshot)
+
+        return snapshot
+
+    def _store(self, key: str, etag: Optional[str], snapshot: Any) -> None:
+        with self._lock:
+            self._snapshots.pop(key, None)
+
+        if etag is None:
+            self._logger.info(f"No ETag received for release '{key}'. Snapshot will not be cached.")
+            return
+
+        with atomic_write(self._snapshot_path(key)) as f:
+            pickle.dump((etag, snapshot), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        with atomic_write(self._meta_path(key), "w") as f:
+            json.dump({"version": self.version, "etag": etag}, f)
+
+        with self._lock:
+            self._snapshots[key] = (etag, snapshot)
@@ -0,0 +1,180 @@
+import logging
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+
+import networkx
+
+from ontology.LabelCompleter import LabelCompleter
+from ontology.ReachabilityIndex import ReachabilityIndex
+from ontology.style import NODE_PROPS, relation_colour
+
+if TYPE_CHECKING:
+    import pyhornedowl
+
+DEFN = "http://purl.obolibrary.org/obo/IAO_0000115"
+SYN = "http://purl.obolibrary.org/obo/IAO_0000118"
+
+
+def _strip_quotes(value: Optional[str]) -> str:
+    # PAT cannot handle commas and quotes in its input
+    return (value or "").replace(",", "").replace("'", "").replace("\"", "")
+
+
+class ReleaseIndex:
+    """
+    Immutable index of a single release of an ontology.
+
+    The index is built in one pass over the classes and axioms of the parsed release. Every annotation is fetched from
+    the ontology exactly once. Afterwards, all queries are answered from the maps without going back into pyhornedowl.
+    Instances are cached on disk by the `ReleaseCache`.
+
+    All IDs are stored in the form `PREFIX_NUMBER`.
+    """
+    VERSION = 5
+    """
+    Format version of the pickled index. Increase when changing the attributes.
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, ontology: "pyhornedowl.PyIndexedOntology", config: Dict):
+        """
+        :param ontology: The parsed release with all prefix mappings registered
+        :param config: App configuration
+        """
+        self.graph = networkx.MultiDiGraph()
+        self.label_to_id: Dict[str, str] = {}
+        self.iri_to_id: Dict[str, str] = {}
+        self.id_to_iri: Dict[str, str] = {}
+        self.iri_to_label: Dict[str, str] = {}
+        self.metadata: Dict[str, Dict[str, Optional[str]]] = {}
+        """
+        Label, definition and synonyms by class ID as exported to PAT
+        """
+        self.superclasses: Dict[str, Tuple[str, ...]] = {}
+
+        label_iri = config['RDFSLABEL']
+        # Relations are not classes. Their labels are only fetched once when first used.
+        relation_labels: Dict[str, Optional[str]] = {}
+
+        parent_iris: List[Tuple[str, List[str]]] = []
+        relations: List[Tuple[str, str, str]] = []
+        for class_iri in ontology.get_classes():
+            label = ontology.get_annotation(class_iri, label_iri)
+            if label:
+                self.iri_to_label[class_iri] = label
+
+            class_id = ontology.get_id_for_iri(class_iri)
+            if not class_id:
+                self._logger.debug(f"Could not determine ID for IRI {class_iri}")
+                continue
+
+            class_id = class_id.replace(":", "_")
+            self.iri_to_id[class_iri] = class_id
+            self.id_to_iri[class_id] = class_iri
+            if class_id not in self.metadata:
+                self.metadata[class_id] = {
+                    "id": class_id,
+                    "label": label or None,
+                    "synonyms": _strip_quotes(ontology.get_annotation(class_iri, SYN)),
+                    "definition": _strip_quotes(ontology.get_annotation(class_iri, DEFN)),
+                }
+            if class_id not in self.graph.nodes:
+                if label:
+                    self.label_to_id[label.strip()] = class_id
+                    self.graph.add_node(class_id, label=label.strip().replace(" ", "\n"), **NODE_PROPS)
+                else:
+                    self._logger.debug(f"Could not determine label for IRI {class_iri}")
+
+            parent_iris.append((class_id, ontology.get_superclasses(class_iri)))
+
+            for axiom in ontology.get_axioms_for_iri(class_iri):  # other relationships
+                # Example: ['SubClassOf', 'http://purl.obolibrary.org/obo/CHEBI_27732', ['ObjectSomeValuesFrom', 'http://purl.obolibrary.org/obo/RO_0000087', 'http://purl.obolibrary.org/obo/CHEBI_60809']]
+                if len(axiom) == 3 and axiom[0] == 'SubClassOf' \
+                        and isinstance(axiom[2], list) and len(axiom[2]) == 3 \
+                        and axiom[2][0] == 'ObjectSomeValuesFrom':
+                    rel_iri, target_iri = axiom[2][1], axiom[2][2]
+                    if rel_iri not in relation_labels:
+                        relation_labels[rel_iri] = ontology.get_annotation(rel_iri, label_iri)
+                    relations.append((class_id, relation_labels[rel_iri], target_iri))
+
+        # Edges can only be resolved once all classes are known
+        for class_id, parents in parent_iris:
+            superclasses = []
+            for parent_iri in parents:
+                parent_id = self.iri_to_id.get(parent_iri)
+                if parent_id is not None:
+                    superclasses.append(parent_id)
+
+                parent_label = self.iri_to_label.get(parent_iri)
+                if parent_label and parent_label.strip() in self.label_to_id:
+                    # Subclass relations must be reversed for layout
+                    self.graph.add_edge(self.label_to_id[parent_label.strip()], class_id, dir="back")
+            self.superclasses[class_id] = tuple(superclasses)
+
+        for class_id, rel_name, target_iri in relations:
+            target_label = self.iri_to_label.get(target_iri)
+            if target_label and target_label.strip() in self.label_to_id:
+                self.graph.add_edge(class_id, self.label_to_id[target_label.strip()],
+                                    color=relation_colour(rel_name),
+                                    label=rel_name)
+
+        self.hierarchy = ReachabilityIndex(self.superclasses.keys(),
+                                           ((p, c) for c, ps in self.superclasses.items() for p in ps))
+        """
+        Reachability along subclass relations from superclass to subclass
+        """
+        self.reachability = ReachabilityIndex(self.graph.nodes, self.graph.edges())
+        """
+        Reachability along all edges of the release graph
+        """
+        self.completer = LabelCompleter(self.label_to_id)
+        """
+        Autocompletion of the labels of all classes
+        """
+
+    def labels(self) -> Set[str]:
+        """
+        :return: Labels of all classes in the release
+        """
+        return set(self.iri_to_label.values())
+
+    def lookup(self, label: str) -> Optional[str]:
+        """
+        :return: ID of the class with the given label
+        """
+        return self.label_to_id.get(label)
+
+    def subgraph(self, ids: Iterable[str]) -> networkx.MultiDiGraph:
+        """
+        :return: Read-only view of the release graph induced by the given nodes
+        """
+        return self.graph.subgraph(ids)
+
+    def get_metadata(self, class_ids: Iterable[str]) -> List[Dict[str, Optional[str]]]:
+        """
+        :param class_ids: IDs of the classes. Unknown IDs are ignored.
+        :return: Label, definition and synonyms of the classes in the order they were requested
+        """
+        metadata = self.metadata
+        return [dict(metadata[i]) for i in class_ids if i in metadata]
+
+    def highest_id(self, prefix: str) -> int:
+        """
+        :param prefix: Prefix of the IDs, e.g. `BCIO`
+        :return: Highest number of any class ID with the prefix or 0 if there is none
+        """
+        highest = 0
+        for class_id in self.id_to_iri.keys():
+            id_prefix, _, number = class_id.partition("_")
+            if id_prefix == prefix and number.isdigit():
+                highest = max(highest, int(number))
+        return highest
+
+    def descendants(self, class_ids: Iterable[str]) -> Set[str]:
+        """
+        All direct and indirect subclasses of the given classes.
+
+        :param class_ids: IDs of the classes. Unknown IDs are ignored.
+        :return: IDs of all subclasses
+        """
+        return self.hierarchy.descendants(class_ids)
@@ -0,0 +1,67 @@
+import logging
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+
+class ReleaseRefresher:
+    """
+    Keeps the releases of several repositories up to date in the background.
+
+    Every repository gets its own daemon thread that refreshes the release in a fixed interval. Refreshing builds a
+    complete new snapshot before it replaces the old one, so readers always see the latest complete release and never
+    wait for a download or for parsing, except before the very first snapshot of a repository is available.
+    """
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, repositories: Iterable[str], refresh: Callable[[str], None], interval: float):
+        """
+        :param repositories: Short names of the repositories to refresh
+        :param refresh: Builds and publishes the current release of a repository
+        :param interval: Seconds between two refreshes of the same repository
+        """
+        self.interval = interval
+        self._refresh = refresh
+        self._stop = threading.Event()
+        self._loaded: Dict[str, threading.Event] = {repo: threading.Event() for repo in repositories}
+        self._threads: Dict[str, threading.Thread] = {}
+
+    def start(self) -> None:
+        """
+        Start refreshing all repositories. The first refresh happens immediately.
+        """
+        for repo in self._loaded:
+            if repo in self._threads:
+                continue
+            thread = threading.Thread(target=self._run, args=(repo,), name=f"release-refresher-{repo}", daemon=True)
+            self._threads[repo] = thread
+            thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop refreshing after the currently running refreshes have finished.
+        """
+        self._stop.set()
+
+    def wait(self, repo: str, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the first refresh of a repository to finish, successful or not.
+
+        :param repo: Short name of the repository
+        :param timeout: Maximum number of seconds to wait
+        :return: False if the repository is not refreshed by this refresher or the timeout passed
+        """
+        loaded = self._loaded.get(repo)
+        if loaded is None or repo not in self._threads:
+            return False
+        return loaded.wait(timeout)
+
+    def _run(self, repo: str) -> None:
+        while not self._stop.is_set():
+            try:
+                self._refresh(repo)
+            except Exception as e:
+                self._logger.error(f"Failed to refresh release of '{repo}': {e}")
+            finally:
+                self._loaded[repo].set()
+
+            self._stop.wait(self.interval)
@@ -0,0 +1,134 @@
+import re
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import networkx
+
+from ontology.ReleaseIndex import ReleaseIndex
+from ontology.style import NODE_PROPS, relation_colour
+
+
+class SheetOverlay:
+    """
+    Entities of a spreadsheet layered over an immutable release.
+
+    The overlay only stores the nodes and edges defined by the sheet. It is combined with the graph of the release at
+    query time, so the release itself is never modified. A row shadows the release entity with the same ID: the row
+    defines the parent and the outgoing relations of the entity, so the corresponding release edges are hidden. All
+    other release edges, e.g. to subclasses of the entity, stay visible.
+    """
+
+    def __init__(self, release: ReleaseIndex, data: List[Dict]):
+        """
+        :param release: Release the sheet is layered over
+        :param data: Rows of the sheet as dicts from column name to value
+        """
+        self.release = release
+        self.nodes: Dict[str, Dict] = {}
+        self.edges: List[Tuple[str, str, Dict]] = []
+        self.label_to_id: Dict[str, str] = {}
+        self._targets: Dict[str, List[str]] = {}
+        """
+        Targets of the edges of the sheet by their source
+        """
+
+        entries = [entry for entry in data
+                   if 'ID' in entry and
+                   'Label' in entry and
+                   'Definition' in entry and
+                   'Parent' in entry and
+                   entry['ID']]
+        for entry in entries:
+            entryId = entry['ID'].replace(":", "_")
+            entryLabel = str(entry['Label'] or "").strip()
+            self.label_to_id[entryLabel] = entryId
+            self.nodes[entryId] = dict(label=entryLabel.replace(" ", "\n"), **NODE_PROPS)
+
+        for entry in entries:
+            entryId = entry['ID'].replace(":", "_")
+            entryParent = self.lookup(re.sub("[\\[].*?[\\]]", "", str(entry['Parent'])).strip())
+            if entryParent is not None:  # Subclass relations
+                # Subclass relations must be reversed for layout
+                self.edges.append((entryParent, entryId, {"dir": "back"}))
+            for header in entry.keys():  # Other relations
+                if entry[header] and str(entry[header]).strip() and "REL" in header:
+                    # Get the rel name
+                    rel_names = re.findall(r"'([^']+)'", header)
+                    if len(rel_names) > 0:
+                        rel_name = rel_names[0]
+                        for relValue in str(entry[header]).split(";"):
+                            target = self.lookup(relValue.strip())
+                            if target is not None:
+                                self.edges.append((entryId, target,
+                                                   {"color": relation_colour(rel_name), "label": rel_name}))
+
+        for source, target, _ in self.edges:
+            self._targets.setdefault(source, []).append(target)
+
+    def lookup(self, label: str) -> Optional[str]:
+        """
+        :return: ID of the entity with the given label in the sheet or, if it is not in the sheet, in the release
+        """
+        return self.label_to_id.get(label, self.release.label_to_id.get(label))
+
+    def _hidden(self, source: str, target: str, attrs: Dict) -> bool:
+        if attrs.get("dir") == "back":
+            return target in self.nodes
+        return source in self.nodes
+
+    def successors(self, node: str) -> Iterator[str]:
+        """
+        :return: Targets of the edges of the combined graph starting at the node
+        """
+        release_graph = self.release.graph
+        if node in release_graph:
+            for _, target, attrs in release_graph.out_edges(node, data=True):
+                if not self._hidden(node, target, attrs):
+                    yield target
+        yield from self._targets.get(node, ())
+
+    def reachable(self, nodes: Iterable[str]) -> Set[str]:
+        """
+        All nodes reachable from any of the given nodes along the edges of the combined graph by following at least
+        one edge.
+
+        Answered with a single breadth-first search from all nodes at once, so no index has to be built per sheet. Like
+        `ReachabilityIndex.descendants`, the result may contain given nodes.
+
+        :param nodes: Nodes to start from. Unknown nodes are ignored.
+        :return: The reachable nodes
+        """
+        result: Set[str] = set()
+        queue = deque(nodes)
+        while queue:
+            for target in self.successors(queue.popleft()):
+                if target not in result:
+                    result.add(target)
+                    queue.append(target)
+        return result
+
+    def subgraph(self, ids: Iterable[str]) -> networkx.MultiDiGraph:
+        """
+        :param ids: IDs of the nodes to include. IDs that are neither in the sheet nor the release are ignored.
+        :return: The subgraph of the combined graph induced by the given nodes
+        """
+        release_graph = self.release.graph
+        members: Set[str] = set()
+        graph = networkx.MultiDiGraph()
+        for i in dict.fromkeys(ids):
+            if i in self.nodes:
+                graph.add_node(i, **self.nodes[i])
+            elif i in release_graph:
+                graph.add_node(i, **release_graph.nodes[i])
+            else:
+                continue
+            members.add(i)
+
+        for source, target, attrs in release_graph.subgraph(members).edges(data=True):
+            if not self._hidden(source, target, attrs):
+                graph.add_edge(source, target, **attrs)
+        for source, target, attrs in self.edges:
+            if source in members and target in members:
+                graph.add_edge(source, target, **attrs)
+
+        return graph
@@ -0,0 +1,17 @@
+NODE_PROPS = {"shape": "box", "style": "rounded", "font": "helvetica"}
+"""
+Graphviz attributes of every node in a visualisation
+"""
+
+REL_COLS = {"has part": "blue", "part of": "blue", "contains": "green",
+            "has role": "darkgreen", "is about": "darkgrey",
+            "has participant": "darkblue"}
+"""
+Edge colours of known relations. All other relations are drawn in `DEFAULT_REL_COL`.
+"""
+
+DEFAULT_REL_COL = "orange"
+
+
+def relation_colour(rel_name: str) -> str:
+    return REL_COLS.get(rel_name, DEFAULT_REL_COL)
@@ -0,0 +1,212 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from flask_github import GitHub, GitHubError
+
+from utils.files import atomic_write
+
+
+class GitHubCache:
+    """
+    Cache of GitHub API responses based on conditional requests.
+
+    The ETag and body of every response are kept, and later requests for the same resource send `If-None-Match`.
+    Unchanged resources cost a single `304 Not Modified` round-trip, which does not count against the rate limit of
+    GitHub. Responses depend on the access token, so they are cached per token.
+
+    File contents are stored decoded and separately from the responses, keyed by their blob SHA, in memory and
+    optionally on disk. Responses and file contents are bounded in number or size in memory and in size on disk, and the
+    least recently used entries are evicted first.
+    """
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, cache_dir: Optional[str] = None, max_entries: int = 1024,
+                 max_response_bytes: int = 16 * 1024 * 1024):
+        """
+        :param max_bytes: Maximum size of the file contents kept in memory and on disk each
+        :param cache_dir: Directory to keep responses and file contents in across restarts. Memory only if `None`.
+        :param max_entries: Maximum number of responses kept in memory
+        :param max_response_bytes: Maximum size of the responses kept on disk
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_response_bytes = max_response_bytes
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, Any]]" = OrderedDict()
+        """
+        ETag and body by request key. Bodies do not contain the content of files.
+        """
+        self._blobs: "OrderedDict[str, bytes]" = OrderedDict()
+        self._blob_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        if cache_dir is not None:
+            os.makedirs(os.path.join(cache_dir, "responses"), exist_ok=True)
+            os.makedirs(os.path.join(cache_dir, "blobs"), exist_ok=True)
+
+    def get(self, github: GitHub, resource: str, params: Optional[Dict[str, str]] = None) -> Any:
+        """
+        Get a resource of the GitHub API.
+
+        :param github: Client to send the request with
+        :param resource: Path of the resource, e.g. `repos/owner/name/contents/folder`
+        :param params: Query parameters
+        :return: The decoded JSON body. The content of files is removed, use `get_file` to get it.
+        """
+        return self._request(github, resource, params, conditional=True)[0]
+
+    def get_file(self, github: GitHub, resource: str) -> Tuple[str, bytes]:
+        """
+        Get a file from the contents API.
+
+        :param github: Client to send the request with
+        :param resource: Path of the file, e.g. `repos/owner/name/contents/folder/file.xlsx`
+        :return: Blob SHA and content of the file
+        """
+        body, data = self._request(github, resource, None, conditional=True)
+        if data is None:
+            data = self._get_blob(body["sha"])
+        if data is None:
+            # The content has been evicted since the response was cached
+            body, data = self._request(github, resource, None, conditional=False)
+        return body["sha"], data
+
+    def _request(self, github: GitHub, resource: str, params: Optional[Dict[str, str]],
+                 conditional: bool) -> Tuple[Any, Optional[bytes]]:
+        """
+        :return: The body without file content and the decoded file content if it was part of a new response
+        """
+        authorization = github._get_authorization_header(None)
+        key = hashlib.sha256(json.dumps([authorization, resource, params], sort_keys=True).encode("utf-8")).hexdigest()
+
+        entry = self._get_entry(key) if conditional else None
+        headers = {"If-None-Match": entry[0]} if entry is not None else {}
+        response = github.raw_request("GET", resource, params=params, headers=headers)
+
+        if response.status_code == 304 and entry is not None:
+            self.hits += 1
+            self._logger.debug(f"Not modified: {resource}")
+            return entry[1], None
+        if not 200 <= response.status_code < 300:
+            raise GitHubError(response)
+
+        self.misses += 1
+        body = response.json()
+        data = None
+        if isinstance(body, dict) and body.get("encoding") == "base64" and "content" in body and "sha" in body:
+            data = base64.b64decode(body["content"])
+            self._put_blob(body["sha"], data)
+            body = {k: v for k, v in body.items() if k != "content"}
+
+        etag = response.headers.get("ETag")
+        if etag:
+            self._put_entry(key, etag, body)
+        return body, data
+
+    def _get_entry(self, key: str) -> Optional[Tuple[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        if self.cache_dir is None:
+            return None
+        path = os.path.join(self.cache_dir, "responses", key)
+        try:
+            with open(path, "r") as f:
+                stored = json.load(f)
+            os.utime(path)  # Marks the file as recently used
+        except (OSError, ValueError):
+            return None
+        entry = (stored["etag"], stored["body"])
+        self._remember_entry(key, entry)
+        return entry
+
+    def _put_entry(self, key: str, etag: str, body: Any) -> None:
+        self._remember_entry(key, (etag, body))
+        if self.cache_dir is not None:
+            self._write(os.path.join(self.cache_dir, "responses", key),
+                        json.dumps({"etag": etag, "body": body}).encode("utf-8"))
+            self._prune_disk("responses", self.max_response_bytes)
+
+    def _remember_entry(self, key: str, entry: Tuple[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_blob(self, sha: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._blobs.get(sha)
+            if data is not None:
+                self._blobs.move_to_end(sha)
+                return data
+
+        if self.cache_dir is None:
+            return None
+        path = os.path.join(self.cache_dir, "blobs", sha)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # Marks the file as recently used
+        except OSError:
+            return None
+        self._remember_blob(sha, data)
+        return data
+
+    def _put_blob(self, sha: str, data: bytes) -> None:
+        self._remember_blob(sha, data)
+        if self.cache_dir is not None and len(data) <= self.max_bytes:
+            self._write(os.path.join(self.cache_dir, "blobs", sha), data)
+            self._prune_disk("blobs", self.max_bytes)
+
+    def _remember_blob(self, sha: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if sha not in self._blobs:
+                self._blobs[sha] = data
+                self._blob_bytes += len(data)
+            self._blobs.move_to_end(sha)
+            while self._blob_bytes > self.max_bytes:
+                _, evicted = self._blobs.popitem(last=False)
+                self._blob_bytes -= len(evicted)
+
+    def _prune_disk(self, folder: str, max_bytes: int) -> None:
+        """
+        Delete the least recently used files of a folder of the cache directory until they fit into `max_bytes`
+        """
+        directory = os.path.join(self.cache_dir, folder)
+        files = []
+        for name in os.listdir(directory):
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+            total -= size
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        with atomic_write(path) as f:
+            f.write(data)
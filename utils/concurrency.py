@@ -0,0 +1,51 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, TypeVar
+
+from flask import current_app, g, has_app_context
+
+T = TypeVar("T")
+
+
+def with_app_context(fn: Callable[..., T]) -> Callable[..., T]:
+    """
+    Make a function callable from worker threads as if it was called in the current request.
+
+    The returned function runs in a new app context of the current app with a copy of all values in `g`, e.g.
+    `g.user` whose access token is used for GitHub requests. Must be called in the thread that owns the context.
+    Outside an app context the function is returned unchanged.
+
+    :param fn: Function to run in worker threads
+    :return: Function that pushes the app context before calling `fn`
+    """
+    if not has_app_context():
+        return fn
+
+    app = current_app._get_current_object()
+    values = dict(vars(g))
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with app.app_context():
+            for key, value in values.items():
+                setattr(g, key, value)
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def run_concurrently(*fns: Callable[[], T]) -> List[T]:
+    """
+    Run independent functions in parallel threads, e.g. to download several files from GitHub at once.
+
+    The functions run in the current app context as described in `with_app_context`.
+
+    :param fns: Functions without arguments
+    :return: The results in the order of the functions. The first exception of any function is raised.
+    """
+    if len(fns) <= 1:
+        return [fn() for fn in fns]
+
+    with ThreadPoolExecutor(len(fns)) as pool:
+        futures = [pool.submit(with_app_context(fn)) for fn in fns]
+        return [future.result() for future in futures]
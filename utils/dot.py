@@ -0,0 +1,49 @@
+from typing import Any, Dict, Iterator
+
+import networkx
+
+_IGNORED_ATTRIBUTES = {"key", "name"}
+"""
+Attributes networkx keeps for itself that are not meaningful to graphviz
+"""
+
+
+def _quote(value: Any) -> str:
+    escaped = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return f"\"{escaped}\""
+
+
+def _attributes(attrs: Dict[str, Any]) -> str:
+    items = [f"{k}={_quote(v)}" for k, v in attrs.items() if k not in _IGNORED_ATTRIBUTES and v is not None]
+    if not items:
+        return ""
+    return f" [{', '.join(items)}]"
+
+
+def _lines(graph: networkx.Graph) -> Iterator[str]:
+    directed = graph.is_directed()
+    edge_op = "->" if directed else "--"
+    strict = "" if graph.is_multigraph() else "strict "
+
+    yield f"{strict}{'digraph' if directed else 'graph'} {{\n"
+    for key, value in graph.graph.items():
+        if key not in _IGNORED_ATTRIBUTES and not isinstance(value, dict):
+            yield f"{key}={_quote(value)};\n"
+    for node, attrs in graph.nodes(data=True):
+        yield f"{_quote(node)}{_attributes(attrs)};\n"
+    for source, target, attrs in graph.edges(data=True):
+        yield f"{_quote(source)} {edge_op} {_quote(target)}{_attributes(attrs)};\n"
+    yield "}\n"
+
+
+def to_dot(graph: networkx.Graph) -> str:
+    """
+    Serialise a graph to DOT.
+
+    Works directly on the node and edge attributes of the graph, so the styling stored in the graph, e.g. the node
+    properties and relation colours, is kept as is. All IDs and values are quoted.
+
+    :param graph: The graph to serialise
+    :return: The DOT representation of the graph
+    """
+    return "".join(_lines(graph))
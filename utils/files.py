@@ -0,0 +1,30 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "wb") -> Iterator[IO]:
+    """
+    Open a file for writing that only replaces `path` once the `with` block completes.
+
+    The content is written to a temporary file next to `path` and moved in place at the end, so concurrent readers,
+    also in other processes, never see a partially written file. If the block raises, `path` is left unchanged. The
+    name of the temporary file ends with `.tmp`.
+
+    :param path: File to write
+    :param mode: Mode to open the temporary file with, either `"wb"` or `"w"`
+    :return: The open temporary file
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, mode) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
@@ -6,20 +6,48 @@ import re
 from typing import List, Tuple, Dict, Optional, Union
 
 import openpyxl
-from flask_github import GitHub
+from flask_github import GitHub, GitHubError
+
+from utils.GitHubCache import GitHubCache
+from utils.concurrency import run_concurrently
 
 _logger = logging.getLogger(__name__)
 
+_cache: Optional[GitHubCache] = None
+
+
+def use_cache(cache: Optional[GitHubCache]) -> None:
+    """
+    Send all requests of this module through the given cache. Requests are not cached if `None`.
+    """
+    global _cache
+    _cache = cache
+
+
+def _get(github: GitHub, resource: str, params: Optional[Dict[str, str]] = None):
+    if _cache is not None:
+        return _cache.get(github, resource, params)
+    return github.get(resource, params=params)
+
+
+def _get_file(github: GitHub, resource: str) -> Tuple[str, bytes]:
+    if _cache is not None:
+        return _cache.get_file(github, resource)
+    file = github.get(resource)
+    return file['sha'], base64.b64decode(file['content'])
+
+
+def get_contents(github: GitHub, repository_name: str, path: str = "") -> Union[List[Dict], Dict]:
+    """
+    :return: The entries of a directory or the metadata of a file as returned by the contents API
+    """
+    return _get(github, f'repos/{repository_name}/contents/{path}')
+
 
 def get_csv(github: GitHub, repository_name: str, folder: str, spreadsheet_name: str) -> Tuple[
     str, List[List[str]], List[str]]:
-    csv_file = github.get(
-        f'repos/{repository_name}/contents/{folder}/{spreadsheet_name}'
-    )
-    file_sha = csv_file['sha']
-    csv_content = csv_file['content']
-    # print(csv_content)
-    decoded_data = str(base64.b64decode(csv_content), 'utf-8')
+    file_sha, csv_content = _get_file(github, f'repos/{repository_name}/contents/{folder}/{spreadsheet_name}')
+    decoded_data = str(csv_content, 'utf-8')
     # print(decoded_data)
     csv_reader = csv.reader(io.StringIO(decoded_data))
     csv_data = list(csv_reader)
@@ -33,13 +61,35 @@ def get_spreadsheet(github: GitHub,
                     repository_name: str,
                     folder: str,
                     spreadsheet: str) -> Tuple[str, List[Dict[str, str]], List[str]]:
-    spreadsheet_file = github.get(
-        f'repos/{repository_name}/contents/{folder}/{spreadsheet}'
-    )
-    file_sha = spreadsheet_file['sha']
-    base64_bytes = spreadsheet_file['content'].encode('utf-8')
-    decoded_data = base64.decodebytes(base64_bytes)
-    wb = openpyxl.load_workbook(io.BytesIO(decoded_data))
+    file_sha, decoded_data = get_spreadsheet_bytes(github, repository_name, folder, spreadsheet)
+    rows, header = parse_spreadsheet(decoded_data, spreadsheet)
+
+    return file_sha, rows, header
+
+
+def get_spreadsheet_bytes(github: GitHub,
+                          repository_name: str,
+                          folder: str,
+                          spreadsheet: str) -> Tuple[str, bytes]:
+    """
+    Download a spreadsheet without parsing it.
+
+    :return: Blob SHA and content of the file
+    """
+    return _get_file(github, f'repos/{repository_name}/contents/{folder}/{spreadsheet}')
+
+
+def parse_spreadsheet(data: bytes, spreadsheet: str = "") -> Tuple[List[Dict[str, str]], List[str]]:
+    """
+    Parse the content of an Excel file. The first row is used as header.
+
+    Only depends on its arguments, so it can be run in another process.
+
+    :param data: Content of the Excel file
+    :param spreadsheet: Name of the spreadsheet for logging
+    :return: Non-empty rows as dicts from header to value and the header
+    """
+    wb = openpyxl.load_workbook(io.BytesIO(data))
     sheet = wb.active
 
     header = [cell.value for cell in sheet[1] if cell.value]
@@ -55,7 +105,7 @@ def get_spreadsheet(github: GitHub,
     except Exception as e:
         _logger.error(f"Could not index {spreadsheet}: {e}")
 
-    return file_sha, rows, header
+    return rows, header
 
 
 def get_spreadsheets(github: GitHub,
@@ -63,14 +113,113 @@ def get_spreadsheets(github: GitHub,
                      folder: str = "",
                      exclude_pattern: Optional[Union[re.Pattern, str]] = None,
                      include_pattern: Optional[Union[re.Pattern, str]] = None) -> List[str]:
-    tree = github.get(
-        f'repos/{repository_name}/git/trees/master',
-        params={"recursive": "true"}
-    )
+    return list(get_spreadsheet_tree(github, repository_name, folder, exclude_pattern, include_pattern).keys())
+
+
+def get_spreadsheet_tree(github: GitHub,
+                         repository_name: str,
+                         folder: str = "",
+                         exclude_pattern: Optional[Union[re.Pattern, str]] = None,
+                         include_pattern: Optional[Union[re.Pattern, str]] = None) -> Dict[str, str]:
+    """
+    List the spreadsheets on the master branch with a single request for the whole git tree.
+
+    :return: Blob SHA of each spreadsheet by its path
+    """
+    tree = _get(github, f'repos/{repository_name}/git/trees/master', params={"recursive": "true"})
     entries = tree["tree"]
 
-    return [x["path"] for x in entries if x["path"].endswith(".xlsx") and
+    return {x["path"]: x["sha"] for x in entries if x["path"].endswith(".xlsx") and
             (re.match(include_pattern, x["path"])
              if include_pattern is not None else
              not (exclude_pattern and re.match(exclude_pattern, x["path"])))
-            ]
+            }
+
+
+def _tree_entry_sha(github: GitHub, repository_name: str, tree_sha: str, path: str) -> Tuple[str, Optional[str]]:
+    """
+    Look up a file in a git tree without downloading its content.
+
+    :param tree_sha: SHA of the tree or of a commit, whose tree is used
+    :return: SHA of the tree and blob SHA of the file at the path below it, or `None` if there is no such file
+    """
+    tree = github.get(f'repos/{repository_name}/git/trees/{tree_sha}', params={"recursive": "1"})
+    sha = next((e["sha"] for e in tree["tree"] if e["path"] == path and e["type"] == "blob"), None)
+    if sha is None and tree.get("truncated"):
+        # Very large trees are not listed completely, so walk down the folders of the path instead
+        sha = tree["sha"]
+        *folders, name = path.split("/")
+        for entry_type, entry_name in [("tree", folder) for folder in folders] + [("blob", name)]:
+            entries = github.get(f'repos/{repository_name}/git/trees/{sha}')["tree"]
+            sha = next((e["sha"] for e in entries if e["path"] == entry_name and e["type"] == entry_type), None)
+            if sha is None:
+                break
+    return tree["sha"], sha
+
+
+def commit_file(github: GitHub,
+                repository_name: str,
+                path: str,
+                content: bytes,
+                message: str,
+                expected_sha: Optional[str] = None,
+                branch: str = "master",
+                attempts: int = 2) -> Optional[Tuple[str, str]]:
+    """
+    Commit a new version of a single file directly to a branch with the Git Data API.
+
+    The blob is uploaded while the head of the branch and the SHA of the current version of the file are looked up,
+    the latter in a single recursive listing of the tree of the head, without downloading the file. A tree and a commit on top of the head are created and the branch is
+    fast-forwarded to the commit. GitHub rejects the update if the branch moved in the meantime, so no concurrent change
+    is ever overwritten. In that case, the commit is created again on top of the new head, as long as the file itself
+    did not change.
+
+    :param github: Client to send the requests with
+    :param repository_name: Full name of the repository, e.g. `owner/name`
+    :param path: Path of the file in the repository
+    :param content: New content of the file
+    :param message: Commit message
+    :param expected_sha: Blob SHA of the version the change is based on. The file is not committed if its current
+        version differs. Not checked if `None`.
+    :param branch: Branch to commit to
+    :param attempts: Number of times to try again if the branch moved concurrently
+    :return: SHA of the new commit and blob SHA of the file, or `None` if the file or the branch changed concurrently
+    """
+    path = path.strip("/")
+    blob = None
+    for attempt in range(attempts):
+        def current_version() -> Tuple[str, str, Optional[str]]:
+            # Not cached, as the head changes with every commit
+            head = github.get(f'repos/{repository_name}/git/ref/heads/{branch}')["object"]["sha"]
+            return (head, *_tree_entry_sha(github, repository_name, head, path))
+
+        def create_blob() -> Dict:
+            return blob or github.post(f'repos/{repository_name}/git/blobs',
+                                       data={"content": base64.b64encode(content).decode("ascii"),
+                                             "encoding": "base64"})
+
+        (head, base_tree, file_sha), blob = run_concurrently(current_version, create_blob)
+
+        if expected_sha is not None and file_sha != expected_sha:
+            _logger.info(f"{path} in {repository_name} changed from {expected_sha} to {file_sha}. Not committing.")
+            return None
+
+        tree = github.post(f'repos/{repository_name}/git/trees',
+                           data={"base_tree": base_tree,
+                                 "tree": [{"path": path, "mode": "100644", "type": "blob", "sha": blob["sha"]}]})
+        new_commit = github.post(f'repos/{repository_name}/git/commits',
+                                 data={"message": message, "tree": tree["sha"], "parents": [head]})
+
+        try:
+            # Only a fast-forward is accepted, which fails if the branch moved since its head was fetched
+            github.patch(f'repos/{repository_name}/git/refs/heads/{branch}',
+                         data={"sha": new_commit["sha"], "force": False})
+        except GitHubError as e:
+            if e.response.status_code != 422:
+                raise
+            _logger.info(f"{branch} of {repository_name} moved while committing {path} (attempt {attempt + 1})")
+            continue
+
+        return new_commit["sha"], blob["sha"]
+
+    return None
@@ -0,0 +1,32 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class PooledSession(requests.Session):
+    """
+    Session that keeps connections alive in a pool shared by all threads, retries failed idempotent requests and
+    applies a default timeout to every request.
+    """
+
+    def __init__(self, pool_size: int = 16, retries: int = 3, timeout: float = 30):
+        """
+        :param pool_size: Maximum number of connections kept open per host
+        :param retries: Number of retries of failed connections and of GET requests answered with 502, 503 or 504
+        :param timeout: Seconds to wait for connecting and for each read, unless a request sets its own timeout
+        """
+        super().__init__()
+        self.timeout = timeout
+        # Only idempotent methods are retried after a response, so a commit is never sent twice
+        retry = Retry(total=retries,
+                      backoff_factor=0.5,
+                      status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset(["GET", "HEAD", "OPTIONS"]),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)